@@ -0,0 +1,290 @@
+""" batch.py - headless rendering of a bunch of replays on a process pool """
+from __future__ import annotations
+
+import contextlib
+import glob
+import os
+import sys
+import time
+from collections.abc import Callable
+from collections.abc import Iterable
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from enum import Enum
+from pathlib import Path
+
+import app.config
+import app.utils
+from app.gazo import Replay2Picture
+from app.generation.common import BloomQuality
+from app.generation.common.vector import Vector2
+from app.objects import difficulty
+from app.objects.beatmap import Beatmap
+from app.objects.replay import ReplayInfo
+
+# Downloads are mostly waiting around, so way more threads than cores.
+PREFETCH_WORKERS: int = 8
+
+
+class RenderStage(Enum):
+    pending = "pending"
+    loading = "loading"
+    calculating = "calculating"
+    rendering = "rendering"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+@dataclass
+class RenderOptions:
+    style: int = 1
+    width: int = 1920
+    height: int = 1080
+    dim: float = 0.6
+    blur: float = 5
+    border: float = 25
+    message: str = ""
+    bloom_quality: BloomQuality = BloomQuality.medium
+
+
+@dataclass
+class RenderJob:
+    replay_path: Path
+    beatmap_path: Path | None = None
+    options: RenderOptions = field(default_factory=RenderOptions)
+
+
+@dataclass
+class RenderResult:
+    replay_path: Path
+    output_path: Path | None = None
+    error: str | None = None
+    elapsed: float = 0.0
+    cache_stats: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def render(
+    job: RenderJob,
+    on_stage: Callable[[RenderStage], None] | None = None,
+) -> Path:
+    on_stage = on_stage or (lambda stage: None)
+
+    on_stage(RenderStage.loading)
+    replay = Replay2Picture.from_replay_file(
+        replay_path=job.replay_path,
+        beatmap_file=job.beatmap_path,
+    )
+
+    on_stage(RenderStage.calculating)
+    replay.calculate()
+
+    on_stage(RenderStage.rendering)
+    return replay.generate(
+        style=job.options.style,
+        resolution=Vector2(x=job.options.width, y=job.options.height),
+        background_dim=job.options.dim,
+        background_blur=job.options.blur,
+        background_border=job.options.border,
+        message=job.options.message,
+        bloom_quality=job.options.bloom_quality,
+        custom_filename=job.replay_path.stem,
+    )
+
+
+def run_job(
+    job: RenderJob,
+    on_stage: Callable[[RenderStage], None] | None = None,
+) -> RenderResult:
+    """renders a single job, never raises so one bad replay can't kill the batch"""
+    result: RenderResult = RenderResult(replay_path=job.replay_path)
+    start: float = time.perf_counter()
+    stats_before: dict[str, int] = difficulty.cache.stats()
+
+    try:
+        result.output_path = render(job, on_stage=on_stage)
+    except SystemExit as err:
+        result.error = f"exited with code {err.code}"
+    except Exception as err:
+        result.error = f"{type(err).__name__}: {err}"
+
+    result.elapsed = time.perf_counter() - start
+    result.cache_stats = {
+        name: count - stats_before[name]
+        for name, count in difficulty.cache.stats().items()
+    }
+    return result
+
+
+def collect_replays(targets: Iterable[str]) -> list[Path]:
+    """expands directories and glob patterns into a sorted list of .osr files"""
+    found: dict[Path, None] = {}
+
+    for target in targets:
+        path: Path = Path(target)
+
+        if path.is_dir():
+            matches = path.glob("*.osr")
+        elif path.is_file():
+            matches = [path]
+        else:
+            matches = (Path(match) for match in glob.glob(target, recursive=True))
+
+        for match in matches:
+            if match.suffix.lower() == ".osr" and match.is_file():
+                found[match.resolve()] = None
+
+    return sorted(found)
+
+
+def _prefetch_beatmap(md5: str | None, beatmap_path: Path | None) -> None:
+    if beatmap_path:
+        beatmap: Beatmap = Beatmap.from_osu_file(beatmap_path)
+    else:
+        beatmap = Beatmap.from_md5(md5)
+
+    beatmap.get_beatmap_background()
+
+
+def prefetch(
+    jobs: list[RenderJob],
+    workers: int = PREFETCH_WORKERS,
+    verbose: bool = False,
+) -> None:
+    """
+    Reads the replay headers first, then downloads every unique beatmap,
+    background and avatar concurrently so the renders only ever hit the caches.
+    """
+    start: float = time.perf_counter()
+
+    beatmaps: dict[tuple[str | None, Path | None], None] = {}
+    players: dict[str, None] = {}
+
+    for job in jobs:
+        try:
+            replay: ReplayInfo = ReplayInfo.from_file(job.replay_path, header_only=True)
+        except Exception:
+            continue  # It'll fail properly once it gets rendered.
+
+        if job.beatmap_path:
+            beatmaps[(None, job.beatmap_path)] = None
+        elif replay.beatmap_md5:
+            beatmaps[(replay.beatmap_md5, None)] = None
+
+        if replay.player_name:
+            players[replay.player_name] = None
+
+    print(
+        f"[Prefetch] Getting {len(beatmaps)} beatmap(s) and {len(players)} avatar(s).",
+    )
+
+    failed: int = 0
+
+    with contextlib.ExitStack() as stack:
+        # The lookups are chatty, and all over the place coming from threads.
+        if not verbose:
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_prefetch_beatmap, md5, beatmap_path)
+                for md5, beatmap_path in beatmaps
+            ] + [pool.submit(app.utils.get_player_avatar, name) for name in players]
+
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except (Exception, SystemExit):
+                    failed += 1
+
+    print(
+        f"[Prefetch] Done in {time.perf_counter() - start:.2f}s"
+        + (f", {failed} failed." if failed else "."),
+    )
+
+
+def _init_worker(verbose: bool, config: app.config.Config) -> None:
+    app.config.use(config)
+
+    # The pipeline is pretty chatty, keep the progress output readable.
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+
+
+def run_batch(
+    jobs: list[RenderJob],
+    workers: int | None = None,
+    verbose: bool = False,
+    prefetch_first: bool = True,
+) -> list[RenderResult]:
+    results: list[RenderResult] = []
+
+    if not jobs:
+        print("[Batch] Nothing to render.")
+        return results
+
+    workers = workers or os.cpu_count() or 1
+
+    if prefetch_first:
+        prefetch(jobs, verbose=verbose)
+
+    print(f"[Batch] Rendering {len(jobs)} replay(s) with {workers} worker(s).")
+
+    start: float = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(verbose, app.config.current),
+    ) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+
+        for future in as_completed(futures):
+            result: RenderResult = future.result()
+            results.append(result)
+
+            elapsed: float = time.perf_counter() - start
+            progress: str = (
+                f"[Batch] ({len(results)}/{len(jobs)} | "
+                f"{len(results) / elapsed:.2f}/s) {result.replay_path.name}"
+            )
+
+            if result.ok:
+                print(f"{progress} -> {result.output_path} ({result.elapsed:.2f}s)")
+            else:
+                print(f"{progress} failed! Reason: {result.error}")
+
+    elapsed = time.perf_counter() - start
+    succeeded: int = sum(result.ok for result in results)
+
+    print(
+        f"[Batch] Rendered {succeeded}/{len(results)} replay(s) in {elapsed:.2f}s "
+        f"({len(results) / elapsed:.2f} replays/s).",
+    )
+
+    cache_stats: dict[str, int] = {}
+    for result in results:
+        for name, count in result.cache_stats.items():
+            cache_stats[name] = cache_stats.get(name, 0) + count
+
+    print(
+        "[Batch] Difficulty cache: "
+        f"{cache_stats.get('hits', 0)} hit(s), {cache_stats.get('misses', 0)} miss(es); "
+        f"performance cache: {cache_stats.get('performance_hits', 0)} hit(s), "
+        f"{cache_stats.get('performance_misses', 0)} miss(es).",
+    )
+
+    if failed := [result for result in results if not result.ok]:
+        print(f"[Batch] {len(failed)} replay(s) failed:")
+        for result in failed:
+            print(f"[Batch]   {result.replay_path}: {result.error}")
+
+    return results
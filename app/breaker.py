@@ -0,0 +1,67 @@
+""" breaker.py - per host circuit breaker, shared by threads and batch workers """
+from __future__ import annotations
+
+import time
+
+import requests
+
+import app.utils
+from app.filelock import FileLock
+
+#
+FAILURE_THRESHOLD: int = 5  # failures in a row before the host is considered down
+COOLDOWN: float = 60.0  # seconds before trying a host that's down again
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """raised instead of sending a request to a host that's known to be down"""
+
+
+def _lock(host: str) -> FileLock:
+    return FileLock(app.utils.CACHE_FOLDER / "breaker" / f"{host}.json")
+
+
+def is_open(host: str) -> bool:
+    with _lock(host) as lock:
+        return lock.read_json().get("open_until", 0.0) > time.time()
+
+
+def before_request(host: str) -> None:
+    """raises if `host` is down, otherwise lets one request through to check on it"""
+    with _lock(host) as lock:
+        state = lock.read_json()
+
+        if state.get("failures", 0) < FAILURE_THRESHOLD:
+            return
+
+        now: float = time.time()
+
+        if (open_until := state.get("open_until", 0.0)) > now:
+            raise CircuitOpenError(
+                f"{host} is down, not trying again for {open_until - now:.0f}s.",
+            )
+
+        # Cooldown's over, this request gets to find out if it's back up. Everyone
+        # else keeps failing fast until it does.
+        state["open_until"] = now + COOLDOWN
+        lock.write_json(state)
+
+
+def record_success(host: str) -> None:
+    with _lock(host) as lock:
+        if lock.read_json().get("failures", 0):
+            lock.write_json({})
+
+
+def record_failure(host: str) -> None:
+    with _lock(host) as lock:
+        state = lock.read_json()
+        state["failures"] = state.get("failures", 0) + 1
+
+        if state["failures"] >= FAILURE_THRESHOLD:
+            if state.get("open_until", 0.0) <= time.time():
+                print(f"[HTTP] {host} looks down, skipping it for {COOLDOWN:.0f}s.")
+
+            state["open_until"] = time.time() + COOLDOWN
+
+        lock.write_json(state)
@@ -0,0 +1,300 @@
+""" cache.py - keeps `.cache` under a size cap, least recently used files go first """
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+import app.config
+import app.utils
+
+# Downloaded files that can always be downloaded again, anything else in .cache is left alone.
+# NOTE: first match wins, beatmap backgrounds sit next to the .osu files.
+CATEGORIES: dict[str, tuple[str, ...]] = {
+    "backgrounds": ("osu/*_bg.png",),
+    "beatmaps": ("osu/*",),
+    "avatars": ("avatars/*", "avatar/*"),
+    "derived": ("derived/*",),
+}
+
+# Never evicted, the renders fall back to these.
+PINNED: frozenset[str] = frozenset(
+    (
+        "default_avatar.png",
+        "default_background.png",
+        "default_star.png",
+        "default_miss.png",
+        "font.ttf",
+    ),
+)
+
+# Files used this recently stay even over the cap when pruning on the side,
+# another worker might be reading them. Asking for a prune skips this.
+MIN_IDLE: float = 10 * 60
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    category TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+@dataclass
+class CategoryStats:
+    category: str
+    entries: int = 0
+    size: int = 0
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float | None:
+        return self.hits / total if (total := self.hits + self.misses) else None
+
+
+@dataclass
+class PruneResult:
+    removed: int = 0
+    freed: int = 0
+    size: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.removed} removed, {format_size(self.freed)} freed, "
+            f"{format_size(self.size)} left"
+        )
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            break
+
+        size /= 1024
+
+    return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+
+
+def category_of(path: Path) -> str | None:
+    try:
+        relative: Path = path.absolute().relative_to(app.utils.CACHE_FOLDER)
+    except ValueError:
+        return None
+
+    if relative.as_posix() in PINNED:
+        return None
+
+    for category, patterns in CATEGORIES.items():
+        if any(relative.match(pattern) for pattern in patterns):
+            return category
+
+    return None
+
+
+class CacheIndex:
+    """
+    Sizes and last access times of the cached files. Files that got there
+    without going through `touch` (older versions, other processes dying
+    halfway...) are picked up by `sync` with their mtime as last access.
+    """
+
+    def __init__(self, path: Path) -> None:
+        # NOTE: app.index needs app.utils to be done loading.
+        from app.index import database
+
+        self.connection: sqlite3.Connection = database.connect(path, SCHEMA)
+
+    def touch(self, path: Path, category: str, hit: bool) -> None:
+        try:
+            size: int = path.stat().st_size
+        except OSError:
+            return
+
+        column: str = "hits" if hit else "misses"
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (str(path.absolute()), category, size, time.time()),
+            )
+            self.connection.execute(
+                "INSERT OR IGNORE INTO counters (category) VALUES (?)",
+                (category,),
+            )
+            self.connection.execute(
+                f"UPDATE counters SET {column} = {column} + 1 WHERE category = ?",
+                (category,),
+            )
+
+    def sync(self) -> None:
+        on_disk: dict[str, tuple[str, os.stat_result]] = {}
+
+        for path, category in _walk():
+            try:
+                on_disk[str(path)] = (category, path.stat())
+            except OSError:
+                continue
+
+        known: set[str] = {
+            row["path"] for row in self.connection.execute("SELECT path FROM entries")
+        }
+
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM entries WHERE path = ?",
+                [(path,) for path in known - on_disk.keys()],
+            )
+            self.connection.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?)",
+                [
+                    (path, category, stat.st_size, stat.st_mtime)
+                    for path, (category, stat) in on_disk.items()
+                    if path not in known
+                ],
+            )
+            # Sizes change when a file gets downloaded again, categories
+            # when they get split up.
+            self.connection.executemany(
+                "UPDATE entries SET size = ?, category = ? WHERE path = ?",
+                [
+                    (stat.st_size, category, path)
+                    for path, (category, stat) in on_disk.items()
+                    if path in known
+                ],
+            )
+
+    def stats(self) -> dict[str, CategoryStats]:
+        stats: dict[str, CategoryStats] = {
+            category: CategoryStats(category) for category in CATEGORIES
+        }
+
+        for row in self.connection.execute(
+            "SELECT category, COUNT(*) AS entries, SUM(size) AS size "
+            "FROM entries GROUP BY category",
+        ):
+            entry = stats.setdefault(row["category"], CategoryStats(row["category"]))
+            entry.entries, entry.size = row["entries"], row["size"] or 0
+
+        for row in self.connection.execute("SELECT * FROM counters"):
+            entry = stats.setdefault(row["category"], CategoryStats(row["category"]))
+            entry.hits, entry.misses = row["hits"], row["misses"]
+
+        return stats
+
+    def prune(self, max_size: float, min_idle: float = MIN_IDLE) -> PruneResult:
+        self.sync()
+
+        result: PruneResult = PruneResult(
+            size=self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries",
+            ).fetchone()[0],
+        )
+        if result.size <= max_size:
+            return result
+
+        removed: list[tuple[str]] = []
+
+        for row in self.connection.execute(
+            "SELECT path, size FROM entries WHERE last_access < ? ORDER BY last_access",
+            (time.time() - min_idle,),
+        ).fetchall():
+            if result.size <= max_size:
+                break
+
+            try:
+                Path(row["path"]).unlink(missing_ok=True)
+            except OSError as err:
+                print(f"[Cache] Failed to remove {row['path']}: {err}")
+                continue
+
+            removed.append((row["path"],))
+            result.removed += 1
+            result.freed += row["size"]
+            result.size -= row["size"]
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM entries WHERE path = ?", removed)
+
+        return result
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def _walk() -> Iterator[tuple[Path, str]]:
+    for category, patterns in CATEGORIES.items():
+        for pattern in patterns:
+            for path in app.utils.CACHE_FOLDER.glob(pattern):
+                # NOTE: *.tmp are downloads that are still being written.
+                if (
+                    path.is_file()
+                    and path.suffix != ".tmp"
+                    and category_of(path) == category
+                ):
+                    yield path.absolute(), category
+
+
+_local: threading.local = threading.local()
+
+
+def get_index() -> CacheIndex:
+    # NOTE: forked batch workers can't share the parent's connection.
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.index = CacheIndex(app.utils.CACHE_FOLDER / "cache.db")
+        _local.pid = os.getpid()
+
+    return _local.index
+
+
+def touch(path: Path, hit: bool) -> None:
+    """marks a cached file as just used, counting whether it had to be downloaded"""
+    if not (category := category_of(path)):
+        return
+
+    try:
+        get_index().touch(path, category, hit)
+    except sqlite3.Error as err:
+        print(f"[Cache] Failed to record access to {path.name}: {err}")
+
+
+def stats() -> dict[str, CategoryStats]:
+    index: CacheIndex = get_index()
+    index.sync()
+
+    return index.stats()
+
+
+def prune(max_size: int | None = None, min_idle: float = MIN_IDLE) -> PruneResult:
+    """evicts the least recently used files until the cache fits in `max_size`"""
+    if max_size is None:
+        max_size = app.config.current.cache_max_size
+
+    return get_index().prune(
+        max_size if max_size is not None else float("inf"),
+        min_idle=min_idle,
+    )
+
+
+def ensure_within_limit() -> int:
+    if app.config.current.cache_max_size is None:
+        return 0
+
+    try:
+        if (result := prune()).removed:
+            print(f"[Cache] Over the size limit, {result}.")
+    except (OSError, sqlite3.Error) as err:
+        print(f"[Cache] Failed to prune the cache: {err}")
+
+    return 0
@@ -0,0 +1,81 @@
+""" cachestore.py - cache files that several processes can write and read at once """
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import app.utils
+from app.filelock import FileLock
+
+# What the start of a file has to look like before it's allowed in the cache.
+MAGIC_BYTES: dict[str, tuple[bytes, ...]] = {
+    "image": (
+        b"\x89PNG\r\n\x1a\n",
+        b"\xff\xd8\xff",  # jpeg
+        b"GIF87a",
+        b"GIF89a",
+    ),
+    "font": (b"\x00\x01\x00\x00", b"OTTO", b"true"),
+    "osu": (b"osu file format",),
+}
+
+# Anything smaller is an error page or a truncated download, not an image.
+MIN_SIZE: dict[str, int] = {
+    "image": 64,
+    "font": 1024,
+    "osu": 32,
+}
+
+
+class InvalidContentError(Exception):
+    ...
+
+
+def validate(data: bytes, kind: str) -> None:
+    """raises `InvalidContentError` unless `data` looks like a `kind` file"""
+    if len(data) < MIN_SIZE.get(kind, 1):
+        raise InvalidContentError(f"too small for a {kind} file ({len(data)} bytes)")
+
+    # .osu files may start with a BOM or a blank line.
+    head: bytes = data.removeprefix(b"\xef\xbb\xbf").lstrip() if kind == "osu" else data
+
+    # NOTE: webp is RIFF????WEBP, the size sits in between.
+    if kind == "image" and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return
+
+    if not head.startswith(MAGIC_BYTES.get(kind, (b"",))):
+        raise InvalidContentError(f"not a valid {kind} file: {data[:16]!r}")
+
+
+def write(path: Path, data: bytes, kind: str | None = None) -> None:
+    """
+    Checks `data` first, then writes it next to `path` and renames it in place,
+    so readers only ever see nothing or the whole file.
+    """
+    if kind:
+        validate(data, kind)
+
+    path.parent.mkdir(exist_ok=True, parents=True)
+
+    temp_path: Path = path.with_name(
+        f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp",
+    )
+
+    try:
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def lock(path: Path) -> FileLock:
+    """
+    Held while `path` is being downloaded, whoever comes second waits and then
+    finds the file already there. Lock files live apart so the cache folders
+    only ever hold finished files.
+    """
+    key: str = hashlib.sha1(str(path.absolute()).encode()).hexdigest()
+    return FileLock(app.utils.CACHE_FOLDER / "locks" / f"{key}.lock")
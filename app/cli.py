@@ -0,0 +1,340 @@
+""" cli.py - headless entry point, `python -m app --help` """
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+
+import app.config
+import app.utils
+from app import batch
+from app import cache
+from app.generation.common import BloomQuality
+from app.index import beatmaps
+from app.index.replays import DATABASE_PATH
+from app.index.replays import ReplayIndex
+
+
+def _parse_date(value: str) -> datetime:
+    try:
+        date: datetime = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO date: {value!r}") from None
+
+    # Replays store their timestamp in UTC.
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def _parse_rate_limit(value: str) -> tuple[str, app.config.RateLimit]:
+    host, _, limit = value.partition("=")
+
+    try:
+        return host.strip(), app.config.RateLimit.from_str(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"expected HOST=PER_MINUTE[/BURST]: {value!r}",
+        ) from None
+
+
+def _parse_size(value: str) -> int:
+    """`500M`, `2G`, `1.5GiB`... plain numbers are bytes"""
+    number = value.strip().upper().removesuffix("IB").removesuffix("B")
+    multiplier: int = 1
+
+    for power, unit in enumerate("KMGT", start=1):
+        if number.endswith(unit):
+            number, multiplier = number[:-1], 1024**power
+            break
+
+    try:
+        return int(float(number) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a size: {value!r}") from None
+
+
+def _query_index(args: argparse.Namespace) -> list[Path]:
+    """indexes the target folders, then returns the replays matching the filters"""
+    folders: list[Path] = [Path(target) for target in args.targets]
+
+    if not_folders := [folder for folder in folders if not folder.is_dir()]:
+        print(f"[Index] Filters only work with replay folders: {not_folders[0]}")
+        return []
+
+    index: ReplayIndex = ReplayIndex(args.database)
+
+    try:
+        for folder in folders:
+            print(f"[Index] {folder}: {index.scan(folder)}")
+
+        return [
+            replay.path
+            for replay in index.query(
+                player=args.player,
+                since=args.since,
+                until=args.until,
+                folders=folders,
+            )
+        ]
+    finally:
+        index.close()
+
+
+def _add_filter_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--player", default=None, help="only replays by this player")
+    parser.add_argument(
+        "--since",
+        type=_parse_date,
+        default=None,
+        help="only replays played on or after this date (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--until",
+        type=_parse_date,
+        default=None,
+        help="only replays played before this date (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--database",
+        type=Path,
+        default=DATABASE_PATH,
+        help="replay index location",
+    )
+
+
+def _run_batch(args: argparse.Namespace) -> int:
+    if args.cache_size is not None:
+        app.config.current.cache_max_size = args.cache_size or None
+
+    for task in (
+        app.utils.ensure_directories,
+        app.utils.ensure_default_assets,
+        cache.ensure_within_limit,
+    ):
+        if code := task():
+            print(f"[Batch] Init failed: {code}")
+            return code
+
+    if args.osu_folder:
+        app.config.current.osu_folder = args.osu_folder
+
+    if args.songs_folder:
+        app.config.current.custom_songs_folder = args.songs_folder
+
+    app.config.current.rate_limits.update(args.rate_limit)
+    app.config.current.hedge_md5_lookups = args.hedge
+
+    # Do it once up front instead of letting the first miss in every worker do it.
+    if not args.beatmap:
+        beatmaps.scan_songs(workers=args.workers)
+
+    options: batch.RenderOptions = batch.RenderOptions(
+        style=args.style,
+        width=args.width,
+        height=args.height,
+        dim=args.dim,
+        blur=args.blur,
+        border=args.border,
+        message=args.message,
+        bloom_quality=BloomQuality[args.bloom_quality],
+    )
+
+    if args.player or args.since or args.until:
+        replays: list[Path] = _query_index(args)
+    else:
+        replays = batch.collect_replays(args.targets)
+
+    jobs: list[batch.RenderJob] = [
+        batch.RenderJob(replay_path=path, beatmap_path=args.beatmap, options=options)
+        for path in replays
+    ]
+
+    results = batch.run_batch(
+        jobs,
+        workers=args.workers,
+        verbose=args.verbose,
+        prefetch_first=not args.no_prefetch,
+    )
+
+    # A big batch can download well past the limit by itself.
+    cache.ensure_within_limit()
+
+    return int(not all(result.ok for result in results))
+
+
+def _run_index(args: argparse.Namespace) -> int:
+    index: ReplayIndex = ReplayIndex(args.database)
+
+    try:
+        for folder in args.folders:
+            if not folder.is_dir():
+                print(f"[Index] Not a folder: {folder}")
+                return 1
+
+            start: float = time.perf_counter()
+            result = index.scan(folder)
+            print(f"[Index] {folder}: {result} ({time.perf_counter() - start:.2f}s)")
+
+        if not (args.player or args.since or args.until):
+            return 0
+
+        for replay in index.query(
+            player=args.player,
+            since=args.since,
+            until=args.until,
+            folders=args.folders,
+        ):
+            print(
+                f"{replay.played_at:%Y-%m-%d %H:%M} {replay.player_name} "
+                f"{replay.score} {replay.max_combo}x {replay.path}",
+            )
+    finally:
+        index.close()
+
+    return 0
+
+
+def _run_cache(args: argparse.Namespace) -> int:
+    if args.action == "prune":
+        max_size: int | None = (
+            app.config.current.cache_max_size
+            if args.max_size is None
+            else args.max_size
+        )
+        if max_size is None:
+            print("[Cache] No size limit, nothing to prune.")
+            return 0
+
+        print(f"[Cache] Pruning down to {cache.format_size(max_size)}.")
+        print(f"[Cache] {cache.prune(max_size, min_idle=0)}")
+        return 0
+
+    print(f"{'category':<12} {'entries':>8} {'size':>12} {'hit rate':>9}")
+
+    total_entries: int = 0
+    total_size: int = 0
+
+    for stats in cache.stats().values():
+        hit_rate: str = f"{stats.hit_rate:.1%}" if stats.hit_rate is not None else "-"
+        print(
+            f"{stats.category:<12} {stats.entries:>8} "
+            f"{cache.format_size(stats.size):>12} {hit_rate:>9}",
+        )
+
+        total_entries += stats.entries
+        total_size += stats.size
+
+    limit: int | None = app.config.current.cache_max_size
+    print(
+        f"{'total':<12} {total_entries:>8} {cache.format_size(total_size):>12}"
+        f" (limit: {cache.format_size(limit) if limit else 'none'})",
+    )
+    return 0
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="osr2png")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # Batch
+    batch_parser = commands.add_parser(
+        "batch",
+        help="render every replay in a folder or glob",
+    )
+    batch_parser.add_argument(
+        "targets",
+        nargs="+",
+        help="replay files, folders or glob patterns",
+    )
+    batch_parser.add_argument("-b", "--beatmap", type=Path, default=None)
+    batch_parser.add_argument(
+        "--osu-folder",
+        type=Path,
+        default=None,
+        help="osu! install to look beatmaps up in (default: %%LOCALAPPDATA%%/osu!)",
+    )
+    batch_parser.add_argument(
+        "--songs-folder",
+        type=Path,
+        default=None,
+        help="Songs folder to hash and look beatmaps up in (default: <osu folder>/Songs)",
+    )
+    batch_parser.add_argument(
+        "--rate-limit",
+        type=_parse_rate_limit,
+        action="append",
+        default=[],
+        metavar="HOST=PER_MINUTE[/BURST]",
+        help="requests per minute allowed to a host, shared by all workers",
+    )
+    batch_parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="ask the osu! api and the mirror for beatmap ids at the same time",
+    )
+    batch_parser.add_argument("-j", "--workers", type=int, default=None)
+    batch_parser.add_argument("-s", "--style", type=int, default=1, choices=[1, 2])
+    batch_parser.add_argument("--width", type=int, default=1920)
+    batch_parser.add_argument("--height", type=int, default=1080)
+    batch_parser.add_argument("--dim", type=float, default=0.6)
+    batch_parser.add_argument("--blur", type=float, default=5)
+    batch_parser.add_argument("--border", type=float, default=25)
+    batch_parser.add_argument("-m", "--message", default="")
+    batch_parser.add_argument(
+        "--bloom-quality",
+        default=BloomQuality.medium.name,
+        choices=[quality.name for quality in BloomQuality],
+        help="how much the text glow gets downscaled before blurring",
+    )
+    batch_parser.add_argument(
+        "--cache-size",
+        type=_parse_size,
+        default=None,
+        metavar="SIZE",
+        help="evict the least recently used downloads past this size, e.g. 2G (0 for no limit)",
+    )
+    batch_parser.add_argument(
+        "--no-prefetch",
+        action="store_true",
+        help="don't download beatmaps, backgrounds and avatars up front",
+    )
+    batch_parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="show the output of the render workers",
+    )
+    _add_filter_arguments(batch_parser)
+    batch_parser.set_defaults(func=_run_batch)
+
+    # Index
+    index_parser = commands.add_parser(
+        "index",
+        help="index replay folders, optionally listing the ones matching a filter",
+    )
+    index_parser.add_argument("folders", nargs="+", type=Path)
+    _add_filter_arguments(index_parser)
+    index_parser.set_defaults(func=_run_index)
+
+    # Cache
+    cache_parser = commands.add_parser(
+        "cache",
+        help="show what's in .cache or shrink it",
+    )
+    cache_parser.add_argument("action", choices=["stats", "prune"])
+    cache_parser.add_argument(
+        "--max-size",
+        type=_parse_size,
+        default=None,
+        metavar="SIZE",
+        help="size to prune down to, e.g. 500M (default: the configured limit)",
+    )
+    cache_parser.set_defaults(func=_run_cache)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = make_parser().parse_args(argv)
+    return args.func(args)
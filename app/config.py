@@ -0,0 +1,88 @@
+""" config.py - runtime settings shared by the gui, the cli and the batch workers """
+from __future__ import annotations
+
+import argparse
+import os
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+
+
+@dataclass
+class RateLimit:
+    per_minute: float
+    burst: int = 1
+
+    @classmethod
+    def from_str(cls, value: str) -> RateLimit:
+        """`60` or `60/10`, requests per minute and optionally the burst size"""
+        per_minute, _, burst = value.partition("/")
+        limit = cls(per_minute=float(per_minute), burst=int(burst or 1))
+
+        # NOTE: caught here, the token bucket would divide by zero in a worker.
+        if limit.per_minute <= 0 or limit.burst < 1:
+            raise argparse.ArgumentTypeError(
+                f"the rate and burst have to be positive: {value!r}",
+            )
+
+        return limit
+
+
+# NOTE: osu! asks for 60 requests per minute on the api, the rest are guesses
+#       that are well below what those hosts put up with.
+DEFAULT_RATE_LIMITS: dict[str, RateLimit] = {
+    "osu.ppy.sh": RateLimit(per_minute=60, burst=10),
+    "osu.direct": RateLimit(per_minute=120, burst=10),
+    "assets.ppy.sh": RateLimit(per_minute=300, burst=20),
+    "a.ppy.sh": RateLimit(per_minute=300, burst=20),
+}
+
+
+def detect_osu_folder() -> Path | None:
+    """default osu!stable install location on windows"""
+    if (local_app_data := os.environ.get("LOCALAPPDATA")) and (
+        folder := Path(local_app_data) / "osu!"
+    ).is_dir():
+        return folder
+
+    return None
+
+
+@dataclass
+class Config:
+    # osu!stable install, used to find beatmaps locally before hitting the network.
+    osu_folder: Path | None = None
+
+    # Songs folder outside of an osu! install (lazer exports, copied folders...).
+    custom_songs_folder: Path | None = None
+
+    # Ask every md5 -> id source at once instead of going down the list.
+    hedge_md5_lookups: bool = False
+
+    # Per host, shared by every thread and batch worker. Hosts not in here aren't limited.
+    rate_limits: dict[str, RateLimit] = field(
+        default_factory=lambda: dict(DEFAULT_RATE_LIMITS),
+    )
+
+    # Downloaded beatmaps, backgrounds and avatars, in bytes. None to let it grow.
+    cache_max_size: int | None = 2 * 1024**3
+
+    @property
+    def osu_db(self) -> Path | None:
+        return self.osu_folder / "osu!.db" if self.osu_folder else None
+
+    @property
+    def songs_folder(self) -> Path | None:
+        if self.custom_songs_folder:
+            return self.custom_songs_folder
+
+        return self.osu_folder / "Songs" if self.osu_folder else None
+
+
+current: Config = Config(osu_folder=detect_osu_folder())
+
+
+def use(config: Config) -> None:
+    """replaces the settings, spawned batch workers need this to see the cli flags"""
+    global current
+    current = config
@@ -0,0 +1,109 @@
+""" filelock.py - exclusive lock on a file, shared by threads and batch workers """
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+from typing import IO
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(file: IO[bytes]) -> None:
+        file.seek(0)
+
+        # NOTE: LK_LOCK only retries for ~10 seconds before giving up.
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock(file: IO[bytes]) -> None:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock(file: IO[bytes]) -> None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(file: IO[bytes]) -> None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+_thread_locks: dict[Path, threading.Lock] = {}
+_thread_locks_lock: threading.Lock = threading.Lock()
+
+
+class FileLock:
+    """
+    The OS locks only keep other processes out, threads of the same process
+    also have to go through a regular lock first.
+
+    The locked file is open for the whole `with` block as `file`, small bits of
+    state can be kept right in it.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path.absolute()
+        self.file: IO[bytes] | None = None
+
+        with _thread_locks_lock:
+            self.thread_lock: threading.Lock = _thread_locks.setdefault(
+                self.path,
+                threading.Lock(),
+            )
+
+    def __enter__(self) -> FileLock:
+        self.thread_lock.acquire()
+
+        try:
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            self.file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT), "r+b")
+            _lock(self.file)
+        except BaseException:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+            self.thread_lock.release()
+            raise
+
+        return self
+
+    def __exit__(self, *_) -> None:
+        try:
+            if self.file:
+                _unlock(self.file)
+                self.file.close()
+        finally:
+            self.file = None
+            self.thread_lock.release()
+
+    def read(self) -> bytes:
+        assert self.file, "lock isn't held"
+
+        self.file.seek(0)
+        return self.file.read()
+
+    def write(self, data: bytes) -> None:
+        assert self.file, "lock isn't held"
+
+        self.file.seek(0)
+        self.file.write(data)
+        self.file.truncate()
+        self.file.flush()
+
+    def read_json(self) -> dict[str, Any]:
+        try:
+            return json.loads(self.read() or b"{}")
+        except ValueError:
+            return {}
+
+    def write_json(self, data: dict[str, Any]) -> None:
+        self.write(json.dumps(data).encode())
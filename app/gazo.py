@@ -5,13 +5,17 @@ from pathlib import Path
 from typing import Any
 from typing import Optional
 
+from rosu_pp_py import DifficultyAttributes
 from rosu_pp_py import PerformanceAttributes
 
 from app.generation.canvas import Canvas
 from app.generation.canvas import CanvasSettings
 from app.generation.canvas import CanvasStyle
 from app.generation.canvas import Vector2
+from app.objects import difficulty
 from app.objects.beatmap import Beatmap
+from app.objects.difficulty import AttributeValues
+from app.objects.replay import Accuracy
 from app.objects.replay import ReplayInfo
 
 #
@@ -27,19 +31,55 @@ class Replay2Picture:
     def __init__(self) -> None:
         self.replay: ReplayInfo
         self.beatmap: Beatmap
-        self.info: PerformanceAttributes
+
+        # Performance, all of them share the same difficulty calculation
+        self.info: PerformanceAttributes | AttributeValues
+        self.info_fc: PerformanceAttributes | AttributeValues
+        self.info_ss: PerformanceAttributes | AttributeValues
+        self.difficulty: DifficultyAttributes | AttributeValues
+        self.max_combo: int
 
     # rosu-pp doesn't yet support csr so this will be vastly different from live pp values
     def calculate(self) -> None:
         print("[Replay2Picture] Calculating PP,", end="")
+        accuracy: Accuracy = self.replay.accuracy  # type: ignore
+
         self.info = self.beatmap.calculate_pp(
             mods=self.replay.mods,  # type: ignore
-            acc=self.replay.accuracy.value,  # type: ignore
+            acc=accuracy.value,
             combo=self.replay.max_combo,  # type: ignore
-            misses=self.replay.accuracy.hitmiss,  # type: ignore
+            misses=accuracy.hitmiss,  # type: ignore
+        )
+        self.difficulty = self.info.difficulty
+        self.max_combo = self.difficulty.max_combo
+
+        # If FC, the misses would've been 300s
+        self.info_fc = self.beatmap.calculate_pp(
+            mods=self.replay.mods,  # type: ignore
+            acc=Accuracy(
+                hit300=accuracy.hit300 + accuracy.hitmiss,
+                hit100=accuracy.hit100,
+                hit50=accuracy.hit50,
+                hitgeki=accuracy.hitgeki,
+                hitkatu=accuracy.hitkatu,
+                hitmiss=0,
+            ).value,
+            combo=self.max_combo,
+            misses=0,
         )
 
-        print(" done!")
+        self.info_ss = self.beatmap.calculate_pp(
+            mods=self.replay.mods,  # type: ignore
+            acc=100.0,
+            combo=self.max_combo,
+            misses=0,
+        )
+
+        print(
+            " done! (difficulty cache: {hits} hit(s), {misses} miss(es))".format(
+                **difficulty.cache.stats(),
+            ),
+        )
 
     def generate(self, style: int = 1, **kwargs: dict[Any, Any]) -> Path:
         custom_filename: str = kwargs.pop("custom_filename", "")  # type: ignore
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from . import assets
 from . import canvas
 from . import common
 from . import text
@@ -0,0 +1,106 @@
+""" assets.py - process-wide cache for the decoded default assets and font """
+from __future__ import annotations
+
+import hashlib
+import io
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image
+from PIL import ImageFilter
+
+import app.utils
+from app import cache
+from app import cachestore
+from app.generation.common.vector import Vector2
+
+# Backgrounds already resized and blurred for a resolution, shared by every process.
+DERIVED_FOLDER: Path = app.utils.CACHE_FOLDER / "derived"
+
+# Bump whenever `load_background` starts producing something different.
+DERIVED_VERSION: int = 2
+
+# Files
+DEFAULT_AVATAR: str = "default_avatar.png"
+DEFAULT_BACKGROUND: str = "default_background.png"
+DEFAULT_STAR: str = "default_star.png"
+DEFAULT_MISS: str = "default_miss.png"
+FONT: str = "font.ttf"
+
+
+def get_path(name: str) -> Path:
+    return app.utils.CACHE_FOLDER / name
+
+
+@lru_cache(maxsize=None)
+def load_image(name: str) -> Image.Image:
+    """decoded RGBA asset, shared by every render so treat it as read-only"""
+    return Image.open(get_path(name)).convert("RGBA")
+
+
+def load_background(
+    path: Path,
+    set_id: int | str,
+    resolution: Vector2,
+    blur: float,
+    style: int,
+) -> Image.Image:
+    """
+    `path` resized to `resolution` and blurred, ready to be pasted. The result
+    is kept on disk so rendering the same map again skips the decode, resize
+    and blur. Anything about the source file changing gives it a new key.
+    """
+    stat = path.stat()
+    width, height = int(resolution.x), int(resolution.y)
+    key: str = hashlib.sha1(
+        f"{DERIVED_VERSION}:{path.resolve()}:{stat.st_mtime_ns}:{stat.st_size}"
+        f":{blur}:{style}".encode(),
+    ).hexdigest()[:16]
+    derived_path: Path = DERIVED_FOLDER / f"{set_id}_{width}x{height}_{key}.png"
+
+    try:
+        background: Image.Image = Image.open(derived_path)
+        background.load()
+    except (OSError, ValueError):
+        pass
+    else:
+        cache.touch(derived_path, hit=True)
+        return background
+
+    # NOTE: the default one goes through `load_image`, which makes it RGBA first.
+    if path == get_path(DEFAULT_BACKGROUND):
+        background = app.utils.fit_image_to_resolution(
+            load_image(DEFAULT_BACKGROUND),
+            Vector2(x=width, y=height),
+        )
+    else:
+        background = app.utils.open_image_for_resolution(
+            path,
+            Vector2(x=width, y=height),
+        )
+
+    if blur:
+        background = background.filter(ImageFilter.GaussianBlur(radius=blur))
+
+    # Lossless, and fast to write since it's read back way more often.
+    buffer: io.BytesIO = io.BytesIO()
+    background.save(buffer, format="PNG", compress_level=1)
+
+    try:
+        cachestore.write(derived_path, buffer.getvalue(), kind="image")
+    except OSError as err:
+        print(f"[Assets] Failed to save the processed background: {err}")
+    else:
+        cache.touch(derived_path, hit=False)
+
+    return background
+
+
+@lru_cache(maxsize=None)
+def load_font_bytes() -> bytes:
+    return get_path(FONT).read_bytes()
+
+
+def clear() -> None:
+    for cached in (load_image, load_font_bytes):
+        cached.cache_clear()
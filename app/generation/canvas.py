@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import math
 from collections.abc import Callable
 from dataclasses import dataclass
 from typing import TYPE_CHECKING
@@ -7,6 +8,7 @@ from typing import TYPE_CHECKING
 from PIL import Image
 
 import app.utils
+from app.generation import assets
 from app.generation import styles
 from app.generation.common import CanvasSettings
 from app.generation.common import CanvasStyle
@@ -20,30 +22,17 @@ if TYPE_CHECKING:
 @dataclass
 class DefaultAssets:
     avatar: Image.Image
-    background: Image.Image
     star: Image.Image
     miss: Image.Image
 
     @classmethod
     def load_default_assets(cls, settings: CanvasSettings) -> DefaultAssets:
-        avatar = Image.open(app.utils.CACHE_FOLDER / "default_avatar.png").convert(
-            "RGBA",
-        )
-        background = Image.open(
-            app.utils.CACHE_FOLDER / "default_background.png",
-        ).convert("RGBA")
-
-        star = Image.open(app.utils.CACHE_FOLDER / "default_star.png").convert("RGBA")
-        miss = Image.open(app.utils.CACHE_FOLDER / "default_miss.png").convert("RGBA")
-
-        # Resize background to fit image
-        background = app.utils.resize_image_to_resolution_but_keep_ratio(
-            background,
-            settings.resolution,
+        return cls(
+            avatar=assets.load_image(assets.DEFAULT_AVATAR),
+            star=assets.load_image(assets.DEFAULT_STAR),
+            miss=assets.load_image(assets.DEFAULT_MISS),
         )
 
-        return cls(avatar=avatar, background=background, star=star, miss=miss)
-
 
 @dataclass
 class Assets:
@@ -94,12 +83,30 @@ class Canvas:
 
         # Load Assets
         default = DefaultAssets.load_default_assets(settings=canvas.settings)
-        background = app.utils.resize_image_to_resolution_but_keep_ratio(
-            Image.open(canvas.context.beatmap.get_beatmap_background()),
-            canvas.settings.resolution,
+
+        background_path = canvas.context.beatmap.get_beatmap_background()
+        background = assets.load_background(
+            background_path,
+            set_id=(
+                "default"
+                if background_path == assets.get_path(assets.DEFAULT_BACKGROUND)
+                else canvas.context.beatmap.set_id
+            ),
+            resolution=canvas.settings.resolution,
+            blur=canvas.settings.background_blur,
+            style=canvas.settings.style.value,
         )
 
-        avatar = Image.open(app.utils.get_player_avatar(canvas.context.replay.player_name)).convert("RGBA")  # type: ignore
+        avatar_path = app.utils.get_player_avatar(canvas.context.replay.player_name)  # type: ignore
+        if avatar_path == assets.get_path(assets.DEFAULT_AVATAR):
+            avatar = default.avatar
+        else:
+            # NOTE: both styles draw it 200px wide at 720p.
+            avatar_size: int = math.ceil(200 * canvas.settings.scale)
+            avatar = app.utils.open_image(
+                avatar_path,
+                (avatar_size, avatar_size),
+            ).convert("RGBA")
 
         canvas.assets = Assets(
             default=default,
@@ -16,6 +16,14 @@ class CanvasStyle(Enum):
     akatsuki = 2
 
 
+class BloomQuality(Enum):
+    # Value is how much the glow gets downscaled before blurring.
+    full = 1
+    high = 2
+    medium = 4
+    low = 8
+
+
 @dataclass
 class CanvasSettings:
     resolution: vector.Vector2 = field(default_factory=vector.Vector2(x=1920, y=1080))  # type: ignore
@@ -30,6 +38,9 @@ class CanvasSettings:
     #
     message: str = field(default="")
 
+    #
+    bloom_quality: BloomQuality = field(default=BloomQuality.medium)
+
     @property
     def scale(self) -> float:
         return self.resolution.y / 720.0
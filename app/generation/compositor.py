@@ -0,0 +1,115 @@
+""" compositor.py - styles as ordered layers, the ones that don't change get drawn once """
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+from typing import TYPE_CHECKING
+
+from PIL import Image
+
+from app.generation.common import CanvasSettings
+from app.generation.text.bloom import SpriteCache
+
+if TYPE_CHECKING:
+    from app.generation.canvas import Canvas
+
+# Rendered static layers, a 1080p one is ~8MB.
+STATIC_CACHE_BYTES: int = 64 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Layer:
+    """
+    Static layers get `(overlay, settings)` and draw onto a transparent image
+    shared by every render with the same resolution and background settings,
+    so they can't look at the replay, beatmap or assets. Anything else gets
+    the `Canvas` and draws straight onto it.
+    """
+
+    draw: Callable[..., None]
+    static: bool = False
+
+
+@dataclass(frozen=True)
+class Style:
+    name: str
+    layers: tuple[Layer, ...]
+
+    def __post_init__(self) -> None:
+        # NOTE: static layers are all flattened into one image, under everything else.
+        first_dynamic: int = next(
+            (i for i, layer in enumerate(self.layers) if not layer.static),
+            len(self.layers),
+        )
+
+        if any(layer.static for layer in self.layers[first_dynamic:]):
+            raise ValueError(f"{self.name}: static layers have to come first")
+
+    @property
+    def static_layers(self) -> tuple[Layer, ...]:
+        return tuple(layer for layer in self.layers if layer.static)
+
+    @property
+    def dynamic_layers(self) -> tuple[Layer, ...]:
+        return tuple(layer for layer in self.layers if not layer.static)
+
+    def render(self, canvas: Canvas) -> None:
+        canvas.canvas.paste(canvas.assets.background)
+
+        if self.static_layers:
+            canvas.canvas.alpha_composite(render_static(self, canvas.settings))
+
+        for layer in self.dynamic_layers:
+            layer.draw(canvas)
+
+
+static_layers: SpriteCache = SpriteCache(STATIC_CACHE_BYTES)
+
+
+def _static_key(style: Style, settings: CanvasSettings) -> tuple[Any, ...]:
+    return (
+        style.name,
+        int(settings.resolution.x),
+        int(settings.resolution.y),
+        settings.background_dim,
+        settings.background_border,
+    )
+
+
+def render_static(style: Style, settings: CanvasSettings) -> Image.Image:
+    """`style`'s static layers flattened, shared between renders so treat it as read-only"""
+    key = _static_key(style, settings)
+
+    if (overlay := static_layers.get(key)) is None:
+        overlay = Image.new(
+            "RGBA",
+            (int(settings.resolution.x), int(settings.resolution.y)),
+            (0, 0, 0, 0),
+        )
+
+        for layer in style.static_layers:
+            layer.draw(overlay, settings)
+
+        static_layers.put(key, overlay)
+
+    return overlay
+
+
+def fill(
+    overlay: Image.Image,
+    color: tuple[int, int, int, int],
+    box: tuple[int, int, int, int],
+) -> None:
+    """composites a `color` rectangle over `box` (left, top, right, bottom)"""
+    left, top, right, bottom = box
+    left, top = max(left, 0), max(top, 0)
+    right, bottom = min(right, overlay.width), min(bottom, overlay.height)
+
+    if right <= left or bottom <= top:
+        return
+
+    overlay.alpha_composite(
+        Image.new("RGBA", (right - left, bottom - top), color),
+        (left, top),
+    )
@@ -7,6 +7,8 @@ from PIL import ImageFilter
 from PIL import ImageOps
 
 import app.utils
+from app.generation import compositor
+from app.generation.common import CanvasSettings
 from app.generation.common import vector
 from app.generation.text.text import TEXT_DEFAULT_SCALE
 from app.generation.text.text import TextAlignment
@@ -19,68 +21,39 @@ __all__: list[str] = ["generate"]
 
 
 # Internals
-def _generate_background(canvas: Canvas) -> None:
-    # Background
-    if canvas.settings.background_blur:
-        # If blur
-        canvas.assets.background = canvas.assets.background.filter(
-            ImageFilter.GaussianBlur(radius=canvas.settings.background_blur),
-        )
-
-    canvas.canvas.paste(canvas.assets.background)
-
-    # Dim
-    dim = Image.new(
-        "RGBA",
-        size=(
-            int(canvas.settings.resolution.x),
-            int(canvas.settings.resolution.y),
-        ),
-        color=(0, 0, 0, int(255 * canvas.settings.background_dim)),
-    )
+def _draw_dim(overlay: Image.Image, settings: CanvasSettings) -> None:
+    # Dim, twice as dark under the line
+    width, height = int(settings.resolution.x), int(settings.resolution.y)
+    color: tuple[int, int, int, int] = (0, 0, 0, int(255 * settings.background_dim))
+    top_space: int = int(160 * settings.scale)
 
-    canvas.canvas.paste(
-        dim,
-        (
-            int((canvas.settings.resolution.x - dim.width) / 2),
-            int((canvas.settings.resolution.y - dim.height) / 2),
-        ),
-        mask=dim,
-    )
-
-    canvas.canvas.paste(
-        dim,
-        (
-            int((canvas.settings.resolution.x - dim.width) / 2),
-            int(160 * canvas.settings.scale),
-        ),
-        mask=dim,
-    )
+    compositor.fill(overlay, color, (0, 0, width, height))
+    compositor.fill(overlay, color, (0, top_space, width, top_space + height))
 
 
-def _generate_line(canvas: Canvas) -> None:
+def _draw_line(overlay: Image.Image, settings: CanvasSettings) -> None:
     # Line
-    top_space: int = int(160 * canvas.settings.scale)
+    top_space: int = int(160 * settings.scale)
 
     top_line_back = Image.new(
         "RGBA",
-        (int(canvas.settings.resolution.x), int(6 * canvas.settings.scale)),
+        (int(settings.resolution.x), int(6 * settings.scale)),
         (0, 0, 0, 255),
     )
 
     top_line = Image.new(
         "RGBA",
-        (int(canvas.settings.resolution.x), int(5 * canvas.settings.scale)),
+        (int(settings.resolution.x), int(5 * settings.scale)),
         (255, 255, 255, 255),
     )
 
     top_line_bloom = Image.new(
         "RGBA",
-        (int(canvas.settings.resolution.x), int(100 * canvas.settings.scale)),
+        (int(settings.resolution.x), int(100 * settings.scale)),
     )
 
     _top_line_bloom_line = top_line.resize(
-        (int(canvas.settings.resolution.x), int(10 * canvas.settings.scale)),
+        (int(settings.resolution.x), int(10 * settings.scale)),
     )
 
     top_line_bloom.paste(
@@ -94,23 +67,8 @@ def _generate_line(canvas: Canvas) -> None:
 
     top_line_bloom = top_line_bloom.filter(ImageFilter.GaussianBlur(10))
 
-    canvas.canvas.paste(
-        top_line_bloom,
-        (0, int(top_space - top_line_bloom.height / 2)),
-        mask=top_line_bloom,
-    )
-
-    canvas.canvas.paste(
-        top_line_back,
-        (0, int(top_space - top_line_back.height / 2)),
-        mask=top_line_back,
-    )
-
-    canvas.canvas.paste(
-        top_line,
-        (0, int(top_space - top_line.height / 2)),
-        mask=top_line,
-    )
+    for line in (top_line_bloom, top_line_back, top_line):
+        overlay.alpha_composite(line, (0, int(top_space - line.height / 2)))
 
 
 def _generate_avatar(canvas: Canvas) -> None:
@@ -185,7 +143,7 @@ def _generate_text(canvas: Canvas) -> None:
 
     # Diff
     canvas.assets.font.draw_text(
-        f"[{canvas.context.beatmap.difficulty}] +{canvas.context.replay.mods!r} | {canvas.context.replay.max_combo}/{canvas.context.beatmap.max_combo}x",
+        f"[{canvas.context.beatmap.difficulty}] +{canvas.context.replay.mods!r} | {canvas.context.replay.max_combo}/{canvas.context.max_combo}x",
         alignment=TextAlignment.centre,
         offset=[100, 50],
         shadow_color=None,
@@ -226,9 +184,7 @@ def _generate_text(canvas: Canvas) -> None:
     # # HACK: If there's no misses but combo doesnt reach >= 60% of the max beatmap combo,
     # # HACK: Just show "?"
     try:
-        print(canvas.context.replay.max_combo)
-        print(canvas.context.beatmap.max_combo)
-        if (canvas.context.replay.max_combo / canvas.context.beatmap.max_combo) <= 0.6 and judge_text == "FC":  # type: ignore
+        if (canvas.context.replay.max_combo / canvas.context.max_combo) <= 0.6 and judge_text == "FC":  # type: ignore
             judge_text = "?"
             judge_color = (255, 255, 0)
     except ZeroDivisionError as e:
@@ -247,10 +203,18 @@ def _generate_text(canvas: Canvas) -> None:
     )
 
 
+STYLE: compositor.Style = compositor.Style(
+    name="akatsuki",
+    layers=(
+        compositor.Layer(_draw_dim, static=True),
+        compositor.Layer(_draw_line, static=True),
+        compositor.Layer(_generate_avatar),
+        compositor.Layer(_generate_text),
+    ),
+)
+
+
 def generate(canvas: Canvas) -> None:
     print("[Style::Akatsuki] Generating!")
 
-    _generate_background(canvas)
-    _generate_line(canvas)
-    _generate_avatar(canvas)
-    _generate_text(canvas)
+    STYLE.render(canvas)
@@ -3,8 +3,9 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from PIL import Image
-from PIL import ImageFilter
 
+from app.generation import compositor
+from app.generation.common import CanvasSettings
 from app.generation.common import vector
 from app.generation.text.text import TEXT_DEFAULT_SCALE
 from app.generation.text.text import TextAlignment
@@ -16,39 +17,21 @@ if TYPE_CHECKING:
 import app.utils
 
 
-def _generate_background(canvas: Canvas) -> None:
-    # Background
-    if canvas.settings.background_blur:
-        # If blur
-        canvas.assets.background = canvas.assets.background.filter(
-            ImageFilter.GaussianBlur(radius=canvas.settings.background_blur),
-        )
-
-    canvas.canvas.paste(canvas.assets.background)
-
-    # Dim
-    dim = Image.new(
-        "RGBA",
-        size=(
-            int(
-                canvas.settings.resolution.x
-                - (canvas.settings.background_border * canvas.settings.scale),
-            ),
-            int(
-                canvas.settings.resolution.y
-                - (canvas.settings.background_border * canvas.settings.scale),
-            ),
-        ),
-        color=(0, 0, 0, int(255 * canvas.settings.background_dim)),
+def _draw_dim(overlay: Image.Image, settings: CanvasSettings) -> None:
+    # Dim, everything but the border
+    width: int = int(
+        settings.resolution.x - (settings.background_border * settings.scale),
+    )
+    height: int = int(
+        settings.resolution.y - (settings.background_border * settings.scale),
     )
+    left: int = int((settings.resolution.x - width) / 2)
+    top: int = int((settings.resolution.y - height) / 2)
 
-    canvas.canvas.paste(
-        dim,
-        (
-            int((canvas.settings.resolution.x - dim.width) / 2),
-            int((canvas.settings.resolution.y - dim.height) / 2),
-        ),
-        mask=dim,
+    compositor.fill(
+        overlay,
+        (0, 0, 0, int(255 * settings.background_dim)),
+        (left, top, left + width, top + height),
     )
 
 
@@ -184,9 +167,17 @@ def _generate_text(canvas: Canvas) -> None:
         )
 
 
+STYLE: compositor.Style = compositor.Style(
+    name="default",
+    layers=(
+        compositor.Layer(_draw_dim, static=True),
+        compositor.Layer(_generate_avatar),
+        compositor.Layer(_generate_text),
+    ),
+)
+
+
 def generate(canvas: Canvas) -> None:
     print("[Style::Default] Generating!")
 
-    _generate_background(canvas)
-    _generate_avatar(canvas)
-    _generate_text(canvas)
+    STYLE.render(canvas)
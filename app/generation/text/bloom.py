@@ -0,0 +1,124 @@
+""" bloom.py - the blurry glow behind text, cached between renders """
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from PIL import Image
+from PIL import ImageDraw
+from PIL import ImageEnhance
+from PIL import ImageFilter
+from PIL import ImageFont
+from PIL import ImageOps
+
+from app.generation.common import BloomQuality
+
+#
+BLOOM_FONT_SCALE: float = 1.1
+BLOOM_SPACE: float = 4
+BLOOM_RADIUS: float = 50
+BLOOM_BRIGHTNESS: float = 3
+
+# Cache
+BLOOM_CACHE_BYTES: int = 128 * 1024 * 1024
+
+
+class SpriteCache:
+    """LRU of rendered sprites, bounded by their decoded size instead of count"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes: int = max_bytes
+        self.size: int = 0
+        self.sprites: OrderedDict[Any, Image.Image] = OrderedDict()
+        self.lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(sprite: Image.Image) -> int:
+        return sprite.width * sprite.height * len(sprite.getbands())
+
+    def get(self, key: Any) -> Image.Image | None:
+        with self.lock:
+            if (sprite := self.sprites.get(key)) is not None:
+                self.sprites.move_to_end(key)
+
+            return sprite
+
+    def put(self, key: Any, sprite: Image.Image) -> None:
+        with self.lock:
+            if key in self.sprites:
+                return
+
+            self.sprites[key] = sprite
+            self.size += self._sizeof(sprite)
+
+            while self.size > self.max_bytes and len(self.sprites) > 1:
+                _, evicted = self.sprites.popitem(last=False)
+                self.size -= self._sizeof(evicted)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.sprites.clear()
+            self.size = 0
+
+
+sprites: SpriteCache = SpriteCache(BLOOM_CACHE_BYTES)
+
+
+def _render_sprite(
+    text: str,
+    font: ImageFont.FreeTypeFont,
+    color: tuple[int, int, int],
+    bloom_size: float,
+    text_size: tuple[int, int],
+    quality: BloomQuality,
+) -> Image.Image:
+    text_width, text_height = text_size
+    bloom_font_scale: float = BLOOM_FONT_SCALE * bloom_size
+
+    sprite: Image.Image = Image.new(
+        "RGBA",
+        (int(text_width), int(text_height)),
+        (0, 0, 0, 0),
+    )
+    ImageDraw.Draw(sprite).text((0, 0), text, fill=color, font=font)
+
+    sprite = sprite.resize(
+        (int(text_width * bloom_font_scale), int(text_height * bloom_font_scale)),
+    )
+    sprite = ImageOps.expand(
+        sprite,
+        ((text_width * BLOOM_SPACE) - sprite.width) // 2,
+    )
+    full_size: tuple[int, int] = sprite.size
+
+    # The glow is a huge blur anyway, so doing it on a downscaled copy
+    # looks about the same for a fraction of the cost.
+    if quality is not BloomQuality.full:
+        sprite = sprite.reduce(quality.value)
+
+    sprite = sprite.filter(ImageFilter.GaussianBlur(BLOOM_RADIUS / quality.value))
+    sprite = ImageEnhance.Brightness(sprite).enhance(BLOOM_BRIGHTNESS)
+
+    if sprite.size != full_size:
+        sprite = sprite.resize(full_size, Image.BILINEAR)
+
+    return sprite
+
+
+def get_sprite(
+    text: str,
+    font: ImageFont.FreeTypeFont,
+    color: tuple[int, int, int],
+    bloom_size: float,
+    text_size: tuple[int, int],
+    quality: BloomQuality = BloomQuality.medium,
+) -> Image.Image:
+    """glow sprite for `text`, shared between renders so treat it as read-only"""
+    key = (text, font.size, color, bloom_size, quality)
+
+    if (sprite := sprites.get(key)) is None:
+        sprite = _render_sprite(text, font, color, bloom_size, text_size, quality)
+        sprites.put(key, sprite)
+
+    return sprite
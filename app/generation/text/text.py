@@ -1,21 +1,76 @@
 from __future__ import annotations
 
+import math
 from enum import IntEnum
+from functools import lru_cache
+from io import BytesIO
 from typing import Any
 
 from PIL import Image
 from PIL import ImageDraw
-from PIL import ImageEnhance
-from PIL import ImageFilter
 from PIL import ImageFont
-from PIL import ImageOps
 
+from app.generation import assets
 from app.generation.common import CanvasSettings
 from app.generation.common import vector
-from app.utils import CACHE_FOLDER
+from app.generation.text import bloom
 
 #
 TEXT_DEFAULT_SCALE: int = 55
+TEXT_MINIMUM_SCALE: int = 15
+
+# Caches
+FONT_CACHE_SIZE: int = 64
+FIT_CACHE_SIZE: int = 512
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(pixel_size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(BytesIO(assets.load_font_bytes()), size=pixel_size)
+
+
+@lru_cache(maxsize=FIT_CACHE_SIZE)
+def fit_font_size(text: str, max_width: float, text_size: int, scale: float) -> int:
+    """
+    Pixel size of the biggest font that fits `text` into `max_width`.
+
+    Picks the same size the old "shrink by one point until it fits" loop did,
+    including its quirks (the non-default sizes get scaled twice), but does it
+    with a binary search over the steps instead of trying every single one.
+    """
+    font_size: float = text_size * scale
+    minimum_size: float = TEXT_MINIMUM_SCALE * scale
+
+    def pixel_size(step: int) -> int:
+        if step == 0 and text_size == TEXT_DEFAULT_SCALE:
+            return int(TEXT_DEFAULT_SCALE * scale)
+
+        return int((font_size - step) * scale)
+
+    def fits(step: int) -> bool:
+        return load_font(pixel_size(step)).getbbox(text)[2] <= max_width
+
+    # The loop gives up once the size drops to the minimum, whether it fits or not.
+    last_step: int = max(0, math.ceil(font_size - minimum_size))
+    while last_step > 0 and font_size - (last_step - 1) <= minimum_size:
+        last_step -= 1
+    while font_size - last_step > minimum_size:
+        last_step += 1
+
+    if last_step == 0 or fits(0):
+        return pixel_size(0)
+
+    # Text only gets narrower as the font shrinks.
+    low, high = 1, last_step
+    while low < high:
+        middle: int = (low + high) // 2
+
+        if fits(middle):
+            high = middle
+        else:
+            low = middle + 1
+
+    return pixel_size(low)
 
 
 class TextAlignment(IntEnum):
@@ -32,10 +87,7 @@ class TextComponent:
         self.draw = ImageDraw.Draw(canvas)
 
     def make_font(self, size: float = TEXT_DEFAULT_SCALE) -> ImageFont.FreeTypeFont:
-        return ImageFont.truetype(
-            str(CACHE_FOLDER / "font.ttf"),
-            size=int(size * self.settings.scale),
-        )
+        return load_font(int(size * self.settings.scale))
 
     def draw_text(
         self,
@@ -51,8 +103,6 @@ class TextComponent:
         bloom_size: float = 1.0,
         text_canvas_size: list[float] | None = None,
     ) -> vector.Vector2:
-        font = self.font
-        font_size = text_size * self.settings.scale
         pos_x, pos_y = (_ * self.settings.scale for _ in offset)
 
         if not text_canvas_size:
@@ -63,17 +113,10 @@ class TextComponent:
         if len(text) > 80:
             text = text[:80] + "..."
 
-        # Special case
-        if text_size != TEXT_DEFAULT_SCALE:
-            font = self.make_font(font_size)
-
         # Make sure text fits the screen
-        while (
-            font.getbbox(text)[2] > text_canvas_size[0]
-            and font_size > 15 * self.settings.scale
-        ):
-            font_size -= 1
-            font = self.make_font(font_size)
+        font = load_font(
+            fit_font_size(text, text_canvas_size[0], text_size, self.settings.scale),
+        )
 
         # Font size
         _, _, text_width, text_height = self.draw.textbbox(
@@ -99,53 +142,25 @@ class TextComponent:
         )
 
         # NOTE: bloom
-        # HACK: This is fucked, like really fucked.
         if bloom_color:
-            _bloom_font_scale: float = 1.1 * bloom_size
-            _bloom_canvas: Image.Image = Image.new(
-                "RGBA",
-                (
-                    int(text_width),
-                    int(text_height),
-                ),
-                (0, 0, 0, 0),
+            _bloom_canvas: Image.Image = bloom.get_sprite(
+                text,
+                font,
+                bloom_color,
+                bloom_size,
+                (text_width, text_height),
+                quality=self.settings.bloom_quality,
             )
 
-            _bloom_draw: ImageDraw.ImageDraw = ImageDraw.Draw(_bloom_canvas)
-            _bloom_draw.text((0, 0), text, fill=bloom_color, font=font)
-
-            _bloom_canvas = _bloom_canvas.resize(
+            self.canvas.paste(
+                _bloom_canvas,
                 (
-                    int(text_width * _bloom_font_scale),
-                    int(text_height * _bloom_font_scale),
+                    int(pos_x - (text_width * 3) / 2),
+                    int(pos_y - (text_width * 2.95) / 2),
                 ),
+                mask=_bloom_canvas,
             )
 
-            _bloom_bloom_space: float = 4
-
-            _bloom_canvas = ImageOps.expand(
-                _bloom_canvas,
-                ((text_width * _bloom_bloom_space) - _bloom_canvas.width) // 2,
-            )
-
-            _bloom_canvas = _bloom_canvas.filter(ImageFilter.GaussianBlur(50))
-            _bloom_canvas_brightness = ImageEnhance.Brightness(_bloom_canvas)
-
-            for _ in range(1, 2):
-                # HACK: lol fuck
-                _bloom_canvas = _bloom_canvas_brightness.enhance(3)
-                self.canvas.paste(
-                    _bloom_canvas,
-                    (
-                        int(pos_x - (text_width * 3) / 2),
-                        int(pos_y - (text_width * 2.95) / 2),
-                    ),
-                    mask=_bloom_canvas,
-                )
-
-            # shadow_color = None
-            # outline_color = None
-
         if shadow_color:  # Can be nullable to disable shadow
             self.draw.text((shadow_x, shadow_y), text, fill=shadow_color, font=font)
 
@@ -0,0 +1,156 @@
+""" http.py - one pooled requests session for the whole process """
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import breaker
+from app import ratelimit
+
+#
+USER_AGENT: str = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/51.0.2704.103 Safari/537.36"
+
+# Connection pool, one pool per host, a few connections each for the gui/batch threads.
+POOL_CONNECTIONS: int = 8
+POOL_MAXSIZE: int = 16
+
+# Nothing should be able to hang a render forever.
+CONNECT_TIMEOUT: float = 5.0
+READ_TIMEOUT: float = 30.0
+
+# GETs are retried on connection errors and 5xx, with jittered exponential backoff.
+GET_RETRIES: int = 2
+RETRY_BACKOFF: float = 0.5
+
+# How many times a GET gets sent again after a 429, and the longest we'd wait for it.
+RATE_LIMIT_RETRIES: int = 3
+MAX_RETRY_AFTER: float = 120.0
+
+
+class ResilientAdapter(HTTPAdapter):
+    """
+    Everything that goes out of the process goes through here:
+        - the host's rate limit is respected and a 429 backs everyone off.
+        - requests time out instead of hanging.
+        - GETs are retried when the connection fails or the host has a moment.
+        - hosts that keep failing get skipped for a while (see `breaker`).
+    """
+
+    def send(self, request: requests.PreparedRequest, **kwargs):
+        host: str = urlsplit(request.url).hostname or ""
+        idempotent: bool = request.method in ("GET", "HEAD")
+
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+        retries: int = 0
+        rate_limit_retries: int = 0
+
+        while True:
+            breaker.before_request(host)
+            ratelimit.acquire(host)
+
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if not self._should_retry(host, idempotent, retries):
+                    breaker.record_failure(host)
+                    raise
+
+                retries += 1
+                self._backoff(host, retries, type(err).__name__)
+                continue
+
+            if response.status_code == 429:
+                retry_after: float = ratelimit.parse_retry_after(
+                    response.headers.get("Retry-After"),
+                )
+                ratelimit.block(host, retry_after)
+
+                if (
+                    not idempotent
+                    or rate_limit_retries >= RATE_LIMIT_RETRIES
+                    or retry_after > MAX_RETRY_AFTER
+                ):
+                    return response
+
+                rate_limit_retries += 1
+                print(
+                    f"[HTTP] {host} is rate limiting us, retrying in {retry_after:.1f}s.",
+                )
+                response.close()
+                continue
+
+            if response.status_code >= 500:
+                if not self._should_retry(host, idempotent, retries):
+                    breaker.record_failure(host)
+                    return response
+
+                retries += 1
+                response.close()
+                self._backoff(host, retries, f"HTTP {response.status_code}")
+                continue
+
+            breaker.record_success(host)
+            return response
+
+    @staticmethod
+    def _should_retry(host: str, idempotent: bool, retries: int) -> bool:
+        # NOTE: the breaker counts requests, not attempts, so one bad GET isn't
+        #       worth 3 failures. No point waiting to retry a host that's down either.
+        return idempotent and retries < GET_RETRIES and not breaker.is_open(host)
+
+    @staticmethod
+    def _backoff(host: str, attempt: int, reason: str) -> None:
+        delay: float = random.uniform(0, RETRY_BACKOFF * 2**attempt)
+
+        print(f"[HTTP] {host} failed ({reason}), retrying in {delay:.1f}s.")
+        time.sleep(delay)
+
+
+_lock: threading.Lock = threading.Lock()
+_pid: int = 0
+_adapter: ResilientAdapter | None = None
+_session: requests.Session | None = None
+
+
+def _ensure() -> tuple[ResilientAdapter, requests.Session]:
+    global _pid, _adapter, _session
+
+    with _lock:
+        # NOTE: forked batch workers can't share the parent's sockets.
+        if _adapter is None or _session is None or _pid != os.getpid():
+            _pid = os.getpid()
+            _adapter = ResilientAdapter(
+                pool_connections=POOL_CONNECTIONS,
+                pool_maxsize=POOL_MAXSIZE,
+            )
+
+            _session = requests.Session()
+            _session.headers.update({"User-Agent": USER_AGENT})
+            mount(_session, _adapter)
+
+        return _adapter, _session
+
+
+def mount(
+    session: requests.Session,
+    adapter: ResilientAdapter | None = None,
+) -> requests.Session:
+    """makes `session` go through the shared connection pool, limits and retries"""
+    adapter = adapter or _ensure()[0]
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def get_session() -> requests.Session:
+    return _ensure()[1]
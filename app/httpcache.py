@@ -0,0 +1,262 @@
+""" httpcache.py - files downloaded once, revalidated when they get old """
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import requests
+
+import app.http
+import app.utils
+from app import cache as cache_manager
+from app import cachestore
+from app.singleflight import flights
+
+# How long things are trusted before asking again (seconds)
+AVATAR_TTL: float = 24 * 60 * 60
+USER_ID_TTL: float = 7 * 24 * 60 * 60
+BACKGROUND_TTL: float = 30 * 24 * 60 * 60
+DEFAULT_ASSET_TTL: float = 30 * 24 * 60 * 60
+NEGATIVE_TTL: float = 60 * 60  # 404s, unknown players...
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    ok INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cached_values (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+# Returned by `get_value` when there's nothing (fresh) cached, None is a valid value.
+MISSING: Any = object()
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    ok: bool
+    etag: str | None
+    last_modified: str | None
+    checked_at: float
+
+    def is_fresh(self, ttl: float, negative_ttl: float) -> bool:
+        return time.time() - self.checked_at < (ttl if self.ok else negative_ttl)
+
+
+class HTTPCache:
+    def __init__(self, path: Path) -> None:
+        # NOTE: app.index needs app.utils to be done loading, which imports us.
+        from app.index import database
+
+        self.connection: sqlite3.Connection = database.connect(path, SCHEMA)
+
+    def get(self, url: str) -> CachedResponse | None:
+        row = self.connection.execute(
+            "SELECT * FROM responses WHERE url = ?",
+            (url,),
+        ).fetchone()
+
+        return CachedResponse(**{**dict(row), "ok": bool(row["ok"])}) if row else None
+
+    def put(self, response: CachedResponse) -> None:
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (
+                    response.url,
+                    int(response.ok),
+                    response.etag,
+                    response.last_modified,
+                    response.checked_at,
+                ),
+            )
+
+    def get_value(self, key: str, ttl: float, negative_ttl: float) -> Any:
+        row = self.connection.execute(
+            "SELECT value, checked_at FROM cached_values WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+        if row is None:
+            return MISSING
+
+        value = json.loads(row["value"])
+        if time.time() - row["checked_at"] >= (
+            ttl if value is not None else negative_ttl
+        ):
+            return MISSING
+
+        return value
+
+    def put_value(self, key: str, value: Any) -> None:
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cached_values VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+
+
+_local: threading.local = threading.local()
+
+
+def get_cache() -> HTTPCache:
+    # NOTE: forked batch workers can't share the parent's connection.
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.cache = HTTPCache(app.utils.CACHE_FOLDER / "http.db")
+        _local.pid = os.getpid()
+
+    return _local.cache
+
+
+def fetch(
+    url: str,
+    path: Path,
+    ttl: float,
+    negative_ttl: float = NEGATIVE_TTL,
+    keep_existing: bool = False,
+    kind: str | None = None,
+) -> Path | None:
+    """
+    Makes sure `path` holds a recent enough copy of `url`. None when it doesn't
+    exist (remembered for `negative_ttl`) or couldn't be downloaded at all.
+
+    A file that's already there without us knowing where it came from is
+    either trusted from when it was written, or with `keep_existing` (files
+    people are told to replace themselves) never touched.
+
+    Downloads are checked to look like a `kind` file (see `cachestore`) before
+    they replace anything.
+    """
+
+    def locked_fetch() -> Path | None:
+        # Other processes wait here too, then see what the first one got.
+        with cachestore.lock(path):
+            return _fetch(url, path, ttl, negative_ttl, keep_existing, kind)
+
+    return flights.do(("fetch", url), locked_fetch)
+
+
+def _fetch(
+    url: str,
+    path: Path,
+    ttl: float,
+    negative_ttl: float,
+    keep_existing: bool,
+    kind: str | None,
+) -> Path | None:
+    cache: HTTPCache = get_cache()
+    cached: CachedResponse | None = cache.get(url)
+    exists: bool = path.exists()
+
+    if cached is None and exists:
+        if keep_existing:
+            return path
+
+        # Downloaded before this cache was a thing.
+        cached = CachedResponse(
+            url=url,
+            ok=True,
+            etag=None,
+            last_modified=None,
+            checked_at=path.stat().st_mtime,
+        )
+        cache.put(cached)
+
+    if cached and cached.is_fresh(ttl, negative_ttl):
+        if not cached.ok:
+            return None
+
+        if exists:
+            cache_manager.touch(path, hit=True)
+            return path
+
+    # Conditional GET, the server only sends the file again if it changed.
+    headers: dict[str, str] = {}
+    if cached and cached.ok and exists:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    # Whatever we have is better than nothing when the server's not cooperating.
+    stale: Path | None = path if exists and (not cached or cached.ok) else None
+
+    try:
+        res = app.http.get_session().get(url, headers=headers)
+    except requests.RequestException as err:
+        print(f"[HTTP] Failed to get {url}: {err}")
+        return _touch(stale)
+
+    now: float = time.time()
+
+    with res:
+        if res.status_code == 304 and exists:
+            cached.checked_at = now  # type: ignore
+            cache.put(cached)  # type: ignore
+            cache_manager.touch(path, hit=True)
+            return path
+
+        if res.status_code == 200:
+            try:
+                cachestore.write(path, res.content, kind)
+            except cachestore.InvalidContentError as err:
+                print(f"[HTTP] Got something unexpected from {url}: {err}")
+                return _touch(stale)
+
+            cache.put(
+                CachedResponse(
+                    url=url,
+                    ok=True,
+                    etag=res.headers.get("ETag"),
+                    last_modified=res.headers.get("Last-Modified"),
+                    checked_at=now,
+                ),
+            )
+            cache_manager.touch(path, hit=False)
+            return path
+
+        if 400 <= res.status_code < 500 and res.status_code != 429:
+            print(f"[HTTP] {url} doesn't exist ({res.status_code}).")
+            cache.put(
+                CachedResponse(
+                    url=url,
+                    ok=False,
+                    etag=None,
+                    last_modified=None,
+                    checked_at=now,
+                ),
+            )
+            return None
+
+        print(f"[HTTP] Failed to get {url} ({res.status_code}).")
+        return _touch(stale)
+
+
+def _touch(stale: Path | None) -> Path | None:
+    if stale:
+        cache_manager.touch(stale, hit=True)
+
+    return stale
+
+
+def get_value(key: str, ttl: float, negative_ttl: float = NEGATIVE_TTL) -> Any:
+    """cached value for `key`, `MISSING` if there's none or it's too old"""
+    return get_cache().get_value(key, ttl, negative_ttl)
+
+
+def put_value(key: str, value: Any) -> None:
+    """remembers `value` for `key`, None is remembered as a negative result"""
+    get_cache().put_value(key, value)
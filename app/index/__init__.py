@@ -0,0 +1,6 @@
+from __future__ import annotations
+
+from . import beatmaps
+from . import database
+from . import metadata
+from . import replays
@@ -0,0 +1,324 @@
+""" beatmaps.py - md5 -> local .osu file index, built from osu!.db or the Songs folder """
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import app.config
+import app.utils
+from app.index import database
+from app.index.database import ScanResult
+from app.objects.osudb import OsuDatabase
+
+#
+DATABASE_PATH: Path = app.utils.CACHE_FOLDER / "beatmaps.db"
+
+# Songs folder scanning
+SONGS_RESCAN_INTERVAL: float = 10 * 60  # seconds between rescans triggered by a miss
+PARALLEL_HASH_THRESHOLD: int = 256  # below that, spinning up a pool isn't worth it
+HASH_CHUNK_SIZE: int = 64
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS local_beatmaps (
+    md5 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    set_id INTEGER NOT NULL,
+    beatmap_id INTEGER NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS local_beatmaps_source ON local_beatmaps (source);
+CREATE TABLE IF NOT EXISTS songs_files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    md5 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_files_md5 ON songs_files (md5);
+CREATE INDEX IF NOT EXISTS songs_files_folder ON songs_files (folder);
+CREATE TABLE IF NOT EXISTS songs_scans (
+    folder TEXT PRIMARY KEY,
+    scanned_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class LocalBeatmap:
+    md5: str
+    path: Path
+    set_id: int
+    beatmap_id: int
+
+
+def _hash_file(path: str) -> str | None:
+    try:
+        with open(path, "rb") as file:
+            return hashlib.file_digest(file, "md5").hexdigest()
+    except OSError:
+        return None
+
+
+def _walk_osu_files(folder: str) -> Iterator[os.DirEntry[str]]:
+    folders: list[str] = [folder]
+
+    while folders:
+        try:
+            with os.scandir(folders.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        folders.append(entry.path)
+                    elif entry.name.lower().endswith(".osu"):
+                        yield entry
+        except OSError:
+            continue
+
+
+class BeatmapIndex:
+    def __init__(self, path: Path = DATABASE_PATH) -> None:
+        self.connection: sqlite3.Connection = database.connect(path, SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def sync_osu_db(self, osu_db: Path, songs_folder: Path) -> bool:
+        """rebuilds the entries coming from `osu_db` if it changed since last time"""
+        try:
+            stat = osu_db.stat()
+        except OSError:
+            return False
+
+        state: tuple[int, int] = (stat.st_mtime_ns, stat.st_size)
+        source: str = str(osu_db.resolve())
+        songs_folder = songs_folder.absolute()
+
+        if self._source_state(source) == state:
+            return False
+
+        # Other batch workers might be about to do the same, the write lock makes
+        # them wait for us and then see the fresh state instead of rebuilding again.
+        self.connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            if self._source_state(source) == state:
+                self.connection.rollback()
+                return False
+
+            print(f"[Index] Reading {osu_db},", end="")
+
+            with OsuDatabase.from_file(osu_db) as osu_database:
+                rows: list[tuple[str, str, int, int, str]] = [
+                    (
+                        beatmap.md5,
+                        str(songs_folder / beatmap.folder / beatmap.filename),
+                        beatmap.set_id,
+                        beatmap.beatmap_id,
+                        source,
+                    )
+                    for beatmap in osu_database.beatmaps()
+                    if beatmap.md5 and beatmap.filename
+                ]
+
+            self.connection.execute(
+                "DELETE FROM local_beatmaps WHERE source = ?",
+                (source,),
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO local_beatmaps VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                (source, *state),
+            )
+            self.connection.commit()
+        except Exception as err:
+            self.connection.rollback()
+            print(f" failed. Reason: {err}")
+            return False
+
+        print(f" {len(rows)} beatmap(s) indexed.")
+        return True
+
+    def _source_state(self, source: str) -> tuple[int, int] | None:
+        row = self.connection.execute(
+            "SELECT mtime_ns, size FROM sources WHERE path = ?",
+            (source,),
+        ).fetchone()
+
+        return (row["mtime_ns"], row["size"]) if row else None
+
+    def scan_songs(self, songs_folder: Path, workers: int | None = None) -> ScanResult:
+        """hashes the .osu files in `songs_folder` that are new or changed since the last scan"""
+        result: ScanResult = ScanResult()
+        folder: str = str(songs_folder.absolute())
+
+        known: dict[str, tuple[int, int]] = {
+            row["path"]: (row["mtime_ns"], row["size"])
+            for row in self.connection.execute(
+                "SELECT path, mtime_ns, size FROM songs_files WHERE folder = ?",
+                (folder,),
+            )
+        }
+        changed: list[tuple[str, int, int]] = []
+
+        for entry in _walk_osu_files(folder):
+            try:
+                stat = entry.stat()
+            except OSError:
+                result.failed += 1
+                continue
+
+            state: tuple[int, int] = (stat.st_mtime_ns, stat.st_size)
+
+            if (previous := known.pop(entry.path, None)) == state:
+                result.unchanged += 1
+                continue
+
+            if previous is None:
+                result.added += 1
+            else:
+                result.updated += 1
+
+            changed.append((entry.path, *state))
+
+        paths: list[str] = [path for path, _, _ in changed]
+
+        if len(paths) >= PARALLEL_HASH_THRESHOLD and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                hashes = list(pool.map(_hash_file, paths, chunksize=HASH_CHUNK_SIZE))
+        else:
+            hashes = [_hash_file(path) for path in paths]
+
+        rows: list[tuple[str, str, int, int, str]] = []
+
+        for (path, mtime_ns, size), md5 in zip(changed, hashes):
+            if md5 is None:
+                result.failed += 1
+                continue
+
+            rows.append((path, folder, mtime_ns, size, md5))
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO songs_files VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.executemany(
+                "DELETE FROM songs_files WHERE path = ?",
+                [(path,) for path in known],
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO songs_scans VALUES (?, ?)",
+                (folder, time.time()),
+            )
+
+        result.removed = len(known)
+        return result
+
+    def songs_scan_due(self, songs_folder: Path) -> bool:
+        row = self.connection.execute(
+            "SELECT scanned_at FROM songs_scans WHERE folder = ?",
+            (str(songs_folder.absolute()),),
+        ).fetchone()
+
+        return row is None or time.time() - row["scanned_at"] > SONGS_RESCAN_INTERVAL
+
+    def lookup(self, md5: str) -> LocalBeatmap | None:
+        row = self.connection.execute(
+            "SELECT * FROM local_beatmaps WHERE md5 = ?",
+            (md5,),
+        ).fetchone()
+
+        if row is not None:
+            return LocalBeatmap(
+                md5=row["md5"],
+                path=Path(row["path"]),
+                set_id=row["set_id"],
+                beatmap_id=row["beatmap_id"],
+            )
+
+        # Hashed files don't know their ids, the .osu has them anyway.
+        row = self.connection.execute(
+            "SELECT path FROM songs_files WHERE md5 = ?",
+            (md5,),
+        ).fetchone()
+
+        if row is not None:
+            return LocalBeatmap(md5=md5, path=Path(row["path"]), set_id=0, beatmap_id=0)
+
+        return None
+
+
+# NOTE: one connection per thread, so transactions from the prefetch threads
+#       don't end up interleaved on the same connection.
+_local: threading.local = threading.local()
+
+
+def get_index() -> BeatmapIndex:
+    # NOTE: forked batch workers can't share the parent's connection.
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.index = BeatmapIndex()
+        _local.pid = os.getpid()
+
+    return _local.index
+
+
+def _should_hash_songs(config: app.config.Config) -> bool:
+    # osu!.db already knows every map, hashing is for when there's none to read.
+    if not config.songs_folder or not config.songs_folder.is_dir():
+        return False
+
+    return bool(config.custom_songs_folder) or not (
+        config.osu_db and config.osu_db.is_file()
+    )
+
+
+def scan_songs(workers: int | None = None) -> ScanResult | None:
+    """brings the Songs folder index up to date, the batch runs this before starting"""
+    if not _should_hash_songs(config := app.config.current):
+        return None
+
+    songs_folder: Path = config.songs_folder  # type: ignore
+
+    print(f"[Index] Scanning {songs_folder},", end="")
+    start: float = time.perf_counter()
+    result: ScanResult = get_index().scan_songs(songs_folder, workers=workers)
+    print(f" {result} ({time.perf_counter() - start:.2f}s)")
+
+    return result
+
+
+def lookup(md5: str) -> LocalBeatmap | None:
+    """finds `md5` in the configured osu! install, None if there's none or it's not there"""
+    config: app.config.Config = app.config.current
+    if not config.songs_folder:
+        return None
+
+    index: BeatmapIndex = get_index()
+
+    if config.osu_db:
+        index.sync_osu_db(config.osu_db, config.songs_folder)
+
+    if local_beatmap := index.lookup(md5):
+        return local_beatmap
+
+    # Rescan every now and then in case the map got added since.
+    # NOTE: this can run inside a batch worker, which mustn't start a pool of its own.
+    if _should_hash_songs(config) and index.songs_scan_due(config.songs_folder):
+        scan_songs(workers=1)
+        return index.lookup(md5)
+
+    return None
@@ -0,0 +1,44 @@
+""" database.py - small helpers shared by the sqlite backed indexes """
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+
+#
+BUSY_TIMEOUT: float = 30.0
+
+
+@dataclass
+class ScanResult:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    failed: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.added} added, {self.updated} updated, {self.removed} removed, "
+            f"{self.unchanged} unchanged, {self.failed} failed"
+        )
+
+
+def connect(path: Path, schema: str = "") -> sqlite3.Connection:
+    """opens (and creates) a database that's safe to share between processes"""
+    path.parent.mkdir(exist_ok=True, parents=True)
+
+    connection = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT,
+        check_same_thread=False,
+    )
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+
+    if schema:
+        with connection:
+            connection.executescript(schema)
+
+    return connection
@@ -0,0 +1,146 @@
+""" metadata.py - md5 -> beatmap id, set id and parsed metadata """
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import app.utils
+from app.index import database
+
+#
+DATABASE_PATH: Path = app.utils.CACHE_FOLDER / "metadata.db"
+
+# Bump whenever the beatmap parser starts picking up something new.
+METADATA_VERSION: int = 2
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS beatmaps (
+    md5 TEXT PRIMARY KEY,
+    file_md5 TEXT,
+    beatmap_id INTEGER NOT NULL,
+    set_id INTEGER NOT NULL,
+    path TEXT,
+    mtime_ns INTEGER,
+    size INTEGER,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class BeatmapMetadata:
+    md5: str
+    file_md5: str
+    beatmap_id: int
+    set_id: int
+    path: Path | None
+    mtime_ns: int | None
+    size: int | None
+    data: dict[str, dict[str, str]]
+
+    @property
+    def file_unchanged(self) -> bool:
+        """whether the .osu is still there, exactly as it was when this got saved"""
+        if not self.path:
+            return False
+
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return False
+
+        return (stat.st_mtime_ns, stat.st_size) == (self.mtime_ns, self.size)
+
+
+class MetadataStore:
+    def __init__(self, path: Path = DATABASE_PATH) -> None:
+        self.connection: sqlite3.Connection = database.connect(path, SCHEMA)
+
+        # NOTE: databases from before file_md5 was a thing, their rows are
+        #       an older METADATA_VERSION anyway.
+        columns: set[str] = {
+            row["name"]
+            for row in self.connection.execute("PRAGMA table_info(beatmaps)")
+        }
+        if "file_md5" not in columns:
+            with self.connection:
+                self.connection.execute("ALTER TABLE beatmaps ADD COLUMN file_md5 TEXT")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get(self, md5: str) -> BeatmapMetadata | None:
+        row = self.connection.execute(
+            "SELECT * FROM beatmaps WHERE md5 = ? AND version = ?",
+            (md5, METADATA_VERSION),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return BeatmapMetadata(
+            md5=row["md5"],
+            file_md5=row["file_md5"] or row["md5"],
+            beatmap_id=row["beatmap_id"],
+            set_id=row["set_id"],
+            path=Path(row["path"]) if row["path"] else None,
+            mtime_ns=row["mtime_ns"],
+            size=row["size"],
+            data=json.loads(row["data"]),
+        )
+
+    def put(
+        self,
+        md5: str,
+        file_md5: str,
+        beatmap_id: int,
+        set_id: int,
+        path: Path | None,
+        data: dict[str, Any],
+    ) -> None:
+        mtime_ns: int | None = None
+        size: int | None = None
+
+        if path:
+            try:
+                stat = path.stat()
+                mtime_ns, size = stat.st_mtime_ns, stat.st_size
+            except OSError:
+                path = None
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO beatmaps (md5, file_md5, beatmap_id, set_id, "
+                "path, mtime_ns, size, version, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    md5,
+                    file_md5,
+                    beatmap_id,
+                    set_id,
+                    str(path.absolute()) if path else None,
+                    mtime_ns,
+                    size,
+                    METADATA_VERSION,
+                    json.dumps(data),
+                ),
+            )
+
+
+# NOTE: one connection per thread, so transactions from the prefetch threads
+#       don't end up interleaved on the same connection.
+_local: threading.local = threading.local()
+
+
+def get_store() -> MetadataStore:
+    # NOTE: forked batch workers can't share the parent's connection.
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.store = MetadataStore()
+        _local.pid = os.getpid()
+
+    return _local.store
@@ -0,0 +1,204 @@
+""" replays.py - incremental sqlite index of replay folders """
+from __future__ import annotations
+
+import os
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from typing import Any
+
+import app.utils
+from app.index import database
+from app.index.database import ScanResult
+from app.objects.replay import ReplayInfo
+
+#
+DATABASE_PATH: Path = app.utils.CACHE_FOLDER / "replays.db"
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS replays (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mode INTEGER NOT NULL,
+    beatmap_md5 TEXT NOT NULL,
+    player_name TEXT NOT NULL,
+    replay_md5 TEXT NOT NULL,
+    mods INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    max_combo INTEGER NOT NULL,
+    hit300 INTEGER NOT NULL,
+    hit100 INTEGER NOT NULL,
+    hit50 INTEGER NOT NULL,
+    hitgeki INTEGER NOT NULL,
+    hitkatu INTEGER NOT NULL,
+    hitmiss INTEGER NOT NULL,
+    played_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS replays_player ON replays (player_name COLLATE NOCASE, played_at);
+CREATE INDEX IF NOT EXISTS replays_beatmap ON replays (beatmap_md5);
+CREATE INDEX IF NOT EXISTS replays_folder ON replays (folder);
+"""
+
+
+@dataclass
+class IndexedReplay:
+    path: Path
+    beatmap_md5: str
+    player_name: str
+    replay_md5: str
+    mode: int
+    mods: int
+    score: int
+    max_combo: int
+    hit300: int
+    hit100: int
+    hit50: int
+    hitgeki: int
+    hitkatu: int
+    hitmiss: int
+    played_at: datetime
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> IndexedReplay:
+        values: dict[str, Any] = dict(row)
+
+        return cls(
+            path=Path(values["path"]),
+            played_at=datetime.fromtimestamp(values["played_at"], tz=timezone.utc),
+            **{
+                key: value
+                for key, value in values.items()
+                if key not in ("path", "folder", "mtime_ns", "size", "played_at")
+            },
+        )
+
+
+class ReplayIndex:
+    def __init__(self, path: Path = DATABASE_PATH) -> None:
+        self.connection: sqlite3.Connection = database.connect(path, SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def scan(self, folder: Path) -> ScanResult:
+        """(re)indexes the .osr files in `folder`, only parsing new or changed ones"""
+        result: ScanResult = ScanResult()
+        folder = folder.resolve()
+
+        known: dict[str, tuple[int, int]] = {
+            row["path"]: (row["mtime_ns"], row["size"])
+            for row in self.connection.execute(
+                "SELECT path, mtime_ns, size FROM replays WHERE folder = ?",
+                (str(folder),),
+            )
+        }
+        rows: list[tuple[Any, ...]] = []
+
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(".osr") or not entry.is_file():
+                    continue
+
+                stat = entry.stat()
+                state: tuple[int, int] = (stat.st_mtime_ns, stat.st_size)
+
+                if (previous := known.pop(entry.path, None)) == state:
+                    result.unchanged += 1
+                    continue
+
+                try:
+                    replay = ReplayInfo.from_file(entry.path, header_only=True)
+                    played_at: float = replay.timestamp.timestamp()
+                except Exception as err:
+                    print(f"[Index] Failed to read {entry.name}: {err}")
+                    result.failed += 1
+                    continue
+
+                rows.append(
+                    (
+                        entry.path,
+                        str(folder),
+                        *state,
+                        int(replay.mode),  # type: ignore
+                        replay.beatmap_md5,
+                        replay.player_name,
+                        replay.replay_md5,
+                        int(replay.mods),  # type: ignore
+                        replay.score,
+                        replay.max_combo,
+                        replay.accuracy.hit300,  # type: ignore
+                        replay.accuracy.hit100,  # type: ignore
+                        replay.accuracy.hit50,  # type: ignore
+                        replay.accuracy.hitgeki,  # type: ignore
+                        replay.accuracy.hitkatu,  # type: ignore
+                        replay.accuracy.hitmiss,  # type: ignore
+                        played_at,
+                    ),
+                )
+
+                if previous is None:
+                    result.added += 1
+                else:
+                    result.updated += 1
+
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO replays VALUES ({', '.join('?' * 18)})",
+                rows,
+            )
+            self.connection.executemany(
+                "DELETE FROM replays WHERE path = ?",
+                [(path,) for path in known],
+            )
+
+        result.removed = len(known)
+        return result
+
+    def query(
+        self,
+        player: str | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        beatmap_md5: str | None = None,
+        mods: int | None = None,
+        folders: list[Path] | None = None,
+    ) -> list[IndexedReplay]:
+        conditions: list[str] = []
+        params: list[Any] = []
+
+        if player is not None:
+            conditions.append("player_name = ? COLLATE NOCASE")
+            params.append(player)
+
+        if since is not None:
+            conditions.append("played_at >= ?")
+            params.append(since.timestamp())
+
+        if until is not None:
+            conditions.append("played_at < ?")
+            params.append(until.timestamp())
+
+        if beatmap_md5 is not None:
+            conditions.append("beatmap_md5 = ?")
+            params.append(beatmap_md5)
+
+        if mods is not None:
+            conditions.append("mods = ?")
+            params.append(mods)
+
+        if folders:
+            conditions.append(f"folder IN ({', '.join('?' * len(folders))})")
+            params.extend(str(folder.resolve()) for folder in folders)
+
+        sql: str = "SELECT * FROM replays"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY played_at"
+
+        return [
+            IndexedReplay.from_row(row) for row in self.connection.execute(sql, params)
+        ]
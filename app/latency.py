@@ -0,0 +1,39 @@
+""" latency.py - how fast each lookup source answers, shared by threads and batch workers """
+from __future__ import annotations
+
+import app.utils
+from app.filelock import FileLock
+
+#
+EWMA_ALPHA: float = 0.3  # how much a new sample counts
+FAILURE_PENALTY: float = 5.0  # seconds added to a failed lookup, so flaky sources sink
+
+
+def _lock() -> FileLock:
+    return FileLock(app.utils.CACHE_FOLDER / "latency.json")
+
+
+def record(source: str, seconds: float, ok: bool = True) -> None:
+    if not ok:
+        seconds += FAILURE_PENALTY
+
+    with _lock() as lock:
+        state = lock.read_json()
+
+        if (average := state.get(source)) is None:
+            state[source] = seconds
+        else:
+            state[source] = EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * average
+
+        lock.write_json(state)
+
+
+def averages() -> dict[str, float]:
+    with _lock() as lock:
+        return lock.read_json()
+
+
+def fastest_first(sources: list[str]) -> list[str]:
+    """sources nobody timed yet go first, so they get measured"""
+    known: dict[str, float] = averages()
+    return sorted(sources, key=lambda source: known.get(source, 0.0))
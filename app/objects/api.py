@@ -1,6 +1,7 @@
 """ api.py - v1 and v2 api wrapper """
 from __future__ import annotations
 
+import threading
 from pathlib import Path
 from typing import Self
 # from typing_extensions import Self
@@ -9,6 +10,8 @@ import requests
 from ossapi import Ossapi
 from ossapi import UserLookupKey
 
+import app.http
+
 # Errors
 MISSING_FILE = "[Error] Failed to read api key file [apikey.txt], create it."
 EMPTY_FILE = "[API] No values found in api key file [apikey.txt]."
@@ -24,7 +27,7 @@ SOLUTION_API_V2 = (
 
 class LegacyAPI:
     def __init__(self, key: str) -> None:
-        self.session: requests.Session = requests.Session()
+        self.session: requests.Session = app.http.get_session()
         self.key: str = key
 
     def get_player_id(self, name: str) -> int | None:
@@ -52,9 +55,33 @@ class LegacyAPI:
             return res.json()[0].get("beatmap_id", -1)
 
 
+class PooledOssapi(Ossapi):
+    """Ossapi, but its (re)authenticated sessions go through our connection pool"""
+
+    def authenticate(self, token=None):
+        return app.http.mount(super().authenticate(token=token))
+
+    def _new_client_grant(self, client_id, client_secret):
+        return app.http.mount(super()._new_client_grant(client_id, client_secret))
+
+
 class ModernAPI(LegacyAPI):
-    def __init__(self, client_id: str, client_secret: str) -> None:
-        self.client: Ossapi = Ossapi(client_id, client_secret)
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        token_directory: Path | None = None,
+    ) -> None:
+        # NOTE: with a token directory, the token gets reused until it expires
+        #       instead of logging in again every time the program starts.
+        if token_directory:
+            token_directory.mkdir(exist_ok=True, parents=True)
+
+        self.client: Ossapi = PooledOssapi(
+            client_id,
+            client_secret,
+            token_directory=str(token_directory) if token_directory else None,
+        )
 
     def get_player_id(self, name: str) -> int | None:
         user = self.client.user(name, key=UserLookupKey.USERNAME)
@@ -73,11 +100,16 @@ class APIWrapper:
         return LegacyAPI(key)
 
     @classmethod
-    def from_api_v2_key(cls, client_id: str, client_secret: str) -> Self:
-        return ModernAPI(client_id, client_secret)
+    def from_api_v2_key(
+        cls,
+        client_id: str,
+        client_secret: str,
+        token_directory: Path | None = None,
+    ) -> Self:
+        return ModernAPI(client_id, client_secret, token_directory=token_directory)
 
     @classmethod
-    def from_file(cls, file: Path) -> Self | None:
+    def from_file(cls, file: Path, token_directory: Path | None = None) -> Self | None:
         if not file.exists():
             print(MISSING_FILE)
             print(SOLUTION_API_V1)
@@ -102,10 +134,29 @@ class APIWrapper:
 
         # V2
         if len(lines) == 2:
-            return cls.from_api_v2_key(lines[0], lines[1])
+            return cls.from_api_v2_key(
+                lines[0],
+                lines[1],
+                token_directory=token_directory,
+            )
 
         # Invalid
         print("[API] Invalid api key file.")
         print(SOLUTION_API_V1)
         print(SOLUTION_API_V2)
         raise SystemExit(1)
+
+
+_client: APIWrapper | None = None
+_client_lock: threading.Lock = threading.Lock()
+
+
+def get_client(file: Path, token_directory: Path | None = None) -> APIWrapper:
+    """one client per process, only created once something actually needs it"""
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = APIWrapper.from_file(file, token_directory=token_directory)
+
+        return _client
@@ -1,14 +1,34 @@
 from __future__ import annotations
 
+import hashlib
+import time
+from collections.abc import Callable
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
 from rosu_pp_py import Beatmap as PPBeatmap
+from rosu_pp_py import Difficulty
+from rosu_pp_py import DifficultyAttributes
 from rosu_pp_py import Performance
 from rosu_pp_py import PerformanceAttributes
 
+import app.config
+import app.http
 import app.utils
+from app import breaker
+from app import cache
+from app import cachestore
+from app import httpcache
+from app import latency
+from app.index import beatmaps as local_beatmaps
+from app.index import metadata
+from app.index.metadata import BeatmapMetadata
 from app.objects import api
+from app.objects import difficulty
+from app.objects.difficulty import AttributeValues
+from app.singleflight import flights
 
 #
 CACHE_FOLDER: Path = app.utils.CACHE_FOLDER / "osu"
@@ -22,8 +42,20 @@ OSU_RAW_URL: str = "https://osu.ppy.sh/osu/{id}"
 OSU_BACKGROUND_URL: str = "https://assets.ppy.sh/beatmaps/{set_id}/covers/fullsize.jpg"
 KITSU_MD5_URL: str = "https://osu.direct/api/md5/{md5}"
 
-# Internal
-USER_AGENT: str = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/51.0.2704.103 Safari/537.36"
+# Host(s), for checking on them before asking
+OSU_HOST: str = "osu.ppy.sh"
+KITSU_HOST: str = "osu.direct"
+
+# Parser
+BEATMAP_SECTIONS_AFTER_EVENTS: tuple[str, ...] = (
+    "[TimingPoints]",
+    "[Colours]",
+    "[HitObjects]",
+)
+
+
+class BeatmapNotFoundError(Exception):
+    """raised when a beatmap can't be resolved from any of the sources"""
 
 
 class Beatmap:
@@ -31,15 +63,22 @@ class Beatmap:
 
     def __init__(
         self,
-        data: dict[str, dict[str, str]] = {},
+        data: dict[str, dict[str, str]] | None = None,
         beatmap_path: Path | None = None,
     ) -> None:
-        self.data: dict[str, dict[str, str]] = data
-        self.http: requests.Session = requests.Session()
-        self.api_client: api.APIWrapper = app.utils.get_api_client()
+        self.data: dict[str, dict[str, str]] = data or {}
+        self.http: requests.Session = app.http.get_session()
         self.path = beatmap_path
+        self.md5: str | None = None
 
-        self.http.headers.update({"User-Agent": USER_AGENT})  # Set header
+        # Raw .osu content, only kept around until rosu-pp gets its hands on it.
+        self.raw: bytes | None = None
+        self._pp_beatmap: PPBeatmap | None = None
+
+    @property
+    def api_client(self) -> api.APIWrapper:
+        # NOTE: shared by the whole process and only logs in on first use.
+        return app.utils.get_api_client()
 
     @property
     def id(self) -> int:
@@ -62,24 +101,52 @@ class Beatmap:
         return self.data.get("Metadata", {}).get("Version", SOMETHING_FUCKED_UP)
 
     @property
-    def max_combo(self) -> int:
-        return int(self.data.get("Metadata", {}).get("MaxCombo", 1))
+    def background_filename(self) -> str:
+        return self.data.get("Events", {}).get("Background", "")
 
     """ calcs """
 
+    @property
+    def pp_beatmap(self) -> PPBeatmap:
+        if self._pp_beatmap is None:
+            if self.raw is None:
+                if self.path and not self.path.exists():
+                    print(
+                        "[Beatmap] The fuck, cached beatmap file is gone... Try running the thing again?",
+                    )
+
+                self.raw = self.path.read_bytes()  # type: ignore
+
+            self._pp_beatmap = PPBeatmap(content=self.raw)
+            self.raw = None
+
+        return self._pp_beatmap
+
+    def calculate_difficulty(self, mods: int) -> DifficultyAttributes:
+        if self.md5 and (attributes := difficulty.cache.get(self.md5, mods)):
+            return attributes
+
+        attributes = Difficulty(mods=mods).calculate(self.pp_beatmap)
+
+        if self.md5:
+            difficulty.cache.put(self.md5, mods, attributes)
+
+        return attributes
+
     def calculate_pp(
         self,
         mods: int,
         acc: float,
         combo: int,
         misses: int,
-    ) -> PerformanceAttributes:
-        if self.path and not self.path.exists():
-            print(
-                "[Beatmap] The fuck, cached beatmap file is gone... Try running the thing again?",
-            )
+    ) -> PerformanceAttributes | AttributeValues:
+        score_key: str = f"{acc:.6f}|{combo}|{misses}"
+
+        if self.md5 and (
+            cached := difficulty.cache.get_performance(self.md5, mods, score_key)
+        ):
+            return cached
 
-        pp_bmap = PPBeatmap(path=str(self.path))
         pp_calc = Performance(mods=mods)
 
         # params
@@ -87,24 +154,44 @@ class Beatmap:
         pp_calc.set_combo(combo)
         pp_calc.set_misses(misses)
 
-        return pp_calc.calculate(pp_bmap)
+        result = pp_calc.calculate(self.calculate_difficulty(mods))
+
+        if self.md5:
+            difficulty.cache.put_performance(self.md5, mods, score_key, result)
+
+        return result
 
     """ files """
 
+    def get_local_background(self) -> Path | None:
+        """the background sitting next to a .osu from a Songs folder, if it's there"""
+        if not (self.path and self.background_filename):
+            return None
+
+        # Downloaded .osu files don't come with their folder.
+        if self.path.parent == CACHE_FOLDER:
+            return None
+
+        background_file: Path = self.path.parent / self.background_filename.replace(
+            "\\",
+            "/",
+        )
+        return background_file if background_file.is_file() else None
+
     def get_beatmap_background(self) -> Path:
-        # Download background if doesnt exists
-        if not (background_file := CACHE_FOLDER / f"{self.set_id}_bg.png").exists():
-            print("[API] Getting beatmap background from osu! /assets/,", end="")
-            with self.http.get(OSU_BACKGROUND_URL.format(set_id=self.set_id)) as res:
-                if res.status_code != 200:
-                    print(" failed.")
-                    print(
-                        "[API] Failed to get beatmap background, using the default one.",
-                    )
-                    return app.utils.CACHE_FOLDER / "default_background.png"
+        if local_background := self.get_local_background():
+            return local_background
 
-                print(" success!")
-                background_file.write_bytes(res.content)
+        background_file: Path | None = httpcache.fetch(
+            OSU_BACKGROUND_URL.format(set_id=self.set_id),
+            CACHE_FOLDER / f"{self.set_id}_bg.png",
+            ttl=httpcache.BACKGROUND_TTL,
+            kind="image",
+        )
+
+        if not background_file:
+            print("[API] Failed to get beatmap background, using the default one.")
+            return app.utils.CACHE_FOLDER / "default_background.png"
 
         return background_file
 
@@ -121,92 +208,289 @@ class Beatmap:
     def get_id_from_md5_osu(self, md5: str) -> int:
         return self.api_client.get_beatmap_id_from_md5(md5)
 
+    def _lookup_id(self, api_method: Callable[[str], int], md5: str) -> int:
+        """runs one md5 source, keeping track of how fast it answers"""
+        start: float = time.perf_counter()
+        current_id: int = 0
+
+        try:
+            current_id = int(api_method(md5) or 0)
+        finally:
+            latency.record(
+                api_method.__name__,
+                time.perf_counter() - start,
+                ok=current_id > 0,
+            )
+
+        return current_id
+
+    def _race_md5_sources(
+        self,
+        md5: str,
+        api_methods: list[Callable[[str], int]],
+    ) -> int:
+        """asks every source at once, first valid id wins"""
+        print(
+            f"[API] Racing {', '.join(method.__name__ for method in api_methods)},",
+            end="",
+        )
+
+        pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=len(api_methods))
+        futures = {
+            pool.submit(self._lookup_id, api_method, md5): api_method
+            for api_method in api_methods
+        }
+
+        try:
+            for future in as_completed(futures):
+                try:
+                    if (current_id := future.result()) > 0:
+                        print(f" {futures[future].__name__} won!")
+                        return current_id
+                except Exception as err:
+                    print(f" {futures[future].__name__} failed ({err}),", end="")
+        finally:
+            # NOTE: a request that's already out can't be interrupted, the loser
+            #       just finishes in the background (it has a timeout) and is ignored.
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        print(" all failed.")
+        return 0
+
     @classmethod
     def from_md5(cls, md5: str):
-        beatmap: Beatmap = cls()
+        if known_beatmap := cls.from_metadata(md5):
+            return known_beatmap
 
-        current_id: int = 0
+        if not (beatmap := cls.from_local(md5)):
+            beatmap = cls.from_md5_online(md5)
+
+        beatmap.save_metadata()
 
-        for api_method in [
-            beatmap.get_id_from_md5_osu,
-            beatmap.get_id_from_md5_kitsu,
-        ]:
+        # NOTE: osu! only has the current version of a map, if it got updated since
+        #       the replay was set the file's md5 won't be the one that was asked for.
+        if beatmap.md5 and beatmap.md5 != md5:
             print(
-                f"[API] Trying to get beatmap id from {api_method.__name__}, ",
-                end="",
+                "[Beatmap] Beatmap got updated since the replay was set, using the new version.",
             )
-            try:
-                if (current_id := api_method(md5)) != 0:
-                    print("success!")
-                    break
-            except Exception as err:
-                print(f"failed. Reason: {err}")
+            beatmap.save_metadata(md5)
+
+        return beatmap
+
+    @classmethod
+    def from_md5_online(cls, md5: str):
+        # Seen it before, only the file's gone (cache got cleared?).
+        if (known := cls._get_metadata(md5)) and known.beatmap_id:
+            return cls.from_id(known.beatmap_id)
+
+        beatmap: Beatmap = cls()
+
+        api_methods: dict[str, tuple[Callable[[str], int], str]] = {
+            "get_id_from_md5_osu": (beatmap.get_id_from_md5_osu, OSU_HOST),
+            "get_id_from_md5_kitsu": (beatmap.get_id_from_md5_kitsu, KITSU_HOST),
+        }
+        available: list[Callable[[str], int]] = []
+
+        for name in latency.fastest_first(list(api_methods)):
+            api_method, host = api_methods[name]
+
+            if breaker.is_open(host):
+                print(f"[API] Skipping {name}, {host} is down.")
                 continue
 
-        if current_id == 0:
+            available.append(api_method)
+
+        current_id: int = 0
+
+        if app.config.current.hedge_md5_lookups and len(available) > 1:
+            current_id = beatmap._race_md5_sources(md5, available)
+        else:
+            for api_method in available:
+                print(
+                    f"[API] Trying to get beatmap id from {api_method.__name__}, ",
+                    end="",
+                )
+                try:
+                    if (current_id := beatmap._lookup_id(api_method, md5)) > 0:
+                        print("success!")
+                        break
+                except Exception as err:
+                    print(f"failed. Reason: {err}")
+                    continue
+
+        if current_id <= 0:
             print("[API] Failed to get beatmap id from all sources!")
-            return None
+            raise BeatmapNotFoundError(f"Failed to get beatmap id for {md5}.")
 
         bmap = cls.from_id(current_id)
 
+        # NOTE: really old .osu files don't have their id in them.
+        if not bmap.id:
+            bmap.data.setdefault("Metadata", {})["BeatmapID"] = str(current_id)
+
         return bmap
 
+    @staticmethod
+    def _get_metadata(md5: str) -> BeatmapMetadata | None:
+        try:
+            return metadata.get_store().get(md5)
+        except Exception as err:
+            print(f"[Beatmap] Failed to read beatmap metadata: {err}")
+            return None
+
     @classmethod
-    def from_id(cls, id: int):
-        beatmap: Beatmap = cls()
+    def from_metadata(cls, md5: str) -> Beatmap | None:
+        """a beatmap seen before, without looking it up, reading or parsing it again"""
+        if not (known := cls._get_metadata(md5)) or not known.file_unchanged:
+            return None
+
+        beatmap: Beatmap = cls(data=known.data, beatmap_path=known.path)
+        # NOTE: rows saved for a replay of an older version point to the new
+        #       file, results have to be cached under the md5 of what's there.
+        beatmap.md5 = known.file_md5
+        cache.touch(known.path, hit=True)
+
+        print(f"[Beatmap] Using known beatmap: {known.path}")
+        return beatmap
+
+    def save_metadata(self, md5: str | None = None) -> None:
+        """remembers this beatmap under `md5`, its own md5 by default"""
+        if not (md5 := md5 or self.md5):
+            return
+
+        try:
+            metadata.get_store().put(
+                md5,
+                file_md5=self.md5,
+                beatmap_id=self.id,
+                set_id=self.set_id,
+                path=self.path,
+                data=self.data,
+            )
+        except Exception as err:
+            print(f"[Beatmap] Failed to save beatmap metadata: {err}")
 
+    @classmethod
+    def from_local(cls, md5: str) -> Beatmap | None:
+        """looks the beatmap up in the local osu! install, no requests involved"""
+        try:
+            if not (local_beatmap := local_beatmaps.lookup(md5)):
+                return None
+
+            beatmap: Beatmap = cls.from_osu_file(local_beatmap.path)
+        except Exception as err:
+            print(f"[Beatmap] Failed to load local beatmap: {err}")
+            return None
+
+        # osu!.db can be out of date, e.g. the map got updated but osu! wasn't opened since.
+        if beatmap.md5 != md5:
+            print("[Beatmap] Local beatmap doesn't match the replay, ignoring it.")
+            return None
+
+        print(f"[Beatmap] Using local beatmap: {local_beatmap.path}")
+        return beatmap
+
+    @classmethod
+    def from_id(cls, id: int):
         # Get raw .osu file from osu, if not in cache
-        if not (beatmap_file := CACHE_FOLDER / str(id)).exists():
+        if (beatmap_file := CACHE_FOLDER / str(id)).exists():
+            cache.touch(beatmap_file, hit=True)
+            return cls.from_osu_file(beatmap_file)
+
+        raw: bytes = flights.do(
+            ("osu", id),
+            lambda: cls._download_osu_file(id, beatmap_file),
+        )
+        cache.touch(beatmap_file, hit=False)
+        return cls.from_bytes(raw, path=beatmap_file)
+
+    @staticmethod
+    def _download_osu_file(id: int, beatmap_file: Path) -> bytes:
+        # Another worker process might be downloading it right now.
+        with cachestore.lock(beatmap_file):
+            if beatmap_file.exists():  # Beaten to it
+                return beatmap_file.read_bytes()
+
             print("[API] Getting beatmap from osu! /osu/,", end="")
 
-            with beatmap.http.get(OSU_RAW_URL.format(id=id)) as res:
+            with app.http.get_session().get(OSU_RAW_URL.format(id=id)) as res:
                 if res.status_code != 200:
                     print(" failed.")
                     print("[API] Failed to get beatmap file from osu!.")
                     print(
                         "[API] If this is a custom beatmap, please pass the beatmap path with `-b` param.",
                     )
-                    raise SystemExit(1)
+                    raise BeatmapNotFoundError(f"Failed to get beatmap file for {id}.")
+
+                try:
+                    cachestore.write(beatmap_file, res.content, kind="osu")
+                except cachestore.InvalidContentError as err:
+                    print(" failed.")
+                    raise BeatmapNotFoundError(
+                        f"Got something that isn't a beatmap for {id}: {err}",
+                    ) from None
 
                 print(" success!")
-                beatmap_file.write_bytes(res.content)
-                beatmap.path = beatmap_file
 
-        return beatmap.from_osu_file(beatmap_file)
+        return res.content
 
     @classmethod
     def from_osu_file(cls, path: Path) -> Beatmap:
+        return cls.from_bytes(path.read_bytes(), path=path)
+
+    @classmethod
+    def from_bytes(cls, raw: bytes, path: Path | None = None) -> Beatmap:
         beatmap: Beatmap = cls(beatmap_path=path)
 
-        beatmap.data |= beatmap._parse_beatmap_file_from_path(path)
+        beatmap.data |= beatmap._parse_beatmap_metadata(raw)
+        beatmap.md5 = hashlib.md5(raw).hexdigest()
+        beatmap.raw = raw
         return beatmap
 
     """ spooky shit """
 
     @staticmethod
-    def _parse_beatmap_file_from_path(path: Path) -> dict[str, dict[str, str]]:
-        """really quick and dirty beatmap parser"""
+    def _parse_beatmap_metadata(raw: bytes) -> dict[str, dict[str, str]]:
+        """really quick and dirty beatmap parser, stops once it's past [Events]"""
 
         data: dict[str, dict[str, str]] = {}
         category: str = ""
+        start: int = 0
 
-        # NOTE: in linux this works just fine
-        #       but on windows thing just shits the bed, fuck you windows.
-        for line in (
-            path.read_bytes().decode(encoding="utf-8", errors="ignore").splitlines()
-        ):
-            if not line.strip():
+        # NOTE: walk the lines by hand instead of decoding and splitting the whole
+        #       thing, the hitobjects we don't care about are most of the file.
+        while start < len(raw):
+            if (end := raw.find(b"\n", start)) == -1:
+                end = len(raw)
+
+            line = raw[start:end].decode(encoding="utf-8", errors="ignore").strip()
+            start = end + 1
+
+            if not line:
                 continue
 
             if line.startswith("["):
+                if line in BEATMAP_SECTIONS_AFTER_EVENTS:
+                    break
+
                 category = line.replace("[", "").replace("]", "")
                 data[category] = {}
                 continue
 
             match category:
                 case "General" | "Editor" | "Metadata" | "Difficulty":
-                    items = line.split(":")
-                    data[category][items[0]] = items[1]
+                    key, _, value = line.partition(":")
+                    data[category][key.strip()] = value.strip()
+                case "Events" if "Background" not in data[category]:
+                    # 0,0,"bg.jpg",0,0 - the first type 0 event is the background
+                    event_type, _, params = line.partition(",")
+                    if event_type.strip() not in ("0", "Background"):
+                        continue
+
+                    _, _, filename = params.partition(",")
+                    filename = filename.partition(",")[0].strip().strip('"')
+                    if filename:
+                        data[category]["Background"] = filename
         return data
 
 
@@ -0,0 +1,167 @@
+""" difficulty.py - cache for rosu-pp difficulty and performance attributes """
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from importlib import metadata
+from pathlib import Path
+from typing import Any
+
+from rosu_pp_py import DifficultyAttributes
+
+import app.utils
+from app import cachestore
+
+#
+CACHE_FOLDER: Path = app.utils.CACHE_FOLDER / "difficulty"
+MEMORY_CACHE_SIZE: int = 256
+
+# Scores kept per map and mods, the oldest ones go first.
+PERFORMANCE_ENTRIES: int = 64
+
+try:
+    ROSU_PP_VERSION: str = metadata.version("rosu-pp-py")
+except metadata.PackageNotFoundError:
+    ROSU_PP_VERSION = "unknown"
+
+
+class AttributeValues:
+    """
+    Plain copy of one of rosu-pp's attribute objects.
+
+    The attribute classes from rosu-pp-py can't be pickled nor created from
+    python, so this is what gets written to disk. It quacks like the original
+    for everything the styles read (`pp`, `difficulty.stars`, ...).
+    """
+
+    def __init__(self, values: dict[str, Any]) -> None:
+        self.values: dict[str, Any] = values
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            value = self.values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+        return AttributeValues(value) if isinstance(value, dict) else value
+
+    def __repr__(self) -> str:
+        return f"AttributeValues({self.values!r})"
+
+    @classmethod
+    def from_attributes(cls, attributes: Any) -> AttributeValues:
+        values: dict[str, Any] = {}
+
+        for name in dir(attributes):
+            if name.startswith("_"):
+                continue
+
+            value = getattr(attributes, name)
+
+            if value is None or isinstance(value, bool | int | float | str):
+                values[name] = value
+            elif name == "difficulty":
+                values[name] = cls.from_attributes(value).values
+
+        return cls(values)
+
+
+class DifficultyCache:
+    """
+    Two tiers, keyed by beatmap md5, mods and the rosu-pp version:
+        - memory: the live DifficultyAttributes, used to seed `Performance`
+          so only the cheap performance step has to run.
+        - disk: the performance results (difficulty values included) of the
+          last `PERFORMANCE_ENTRIES` scores, so re-rendering a score skips
+          rosu-pp entirely.
+    """
+
+    def __init__(self, folder: Path, memory_size: int = MEMORY_CACHE_SIZE) -> None:
+        self.folder: Path = folder
+        self.memory_size: int = memory_size
+        self.memory: OrderedDict[tuple[str, int], DifficultyAttributes] = OrderedDict()
+        self.lock: threading.Lock = threading.Lock()
+
+        # Stats
+        self.hits: int = 0
+        self.misses: int = 0
+        self.performance_hits: int = 0
+        self.performance_misses: int = 0
+
+    def _path(self, md5: str, mods: int) -> Path:
+        return self.folder / f"{md5}_{int(mods)}_{ROSU_PP_VERSION}.json"
+
+    def _read(self, md5: str, mods: int) -> dict[str, Any]:
+        try:
+            return json.loads(self._path(md5, mods).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    """ difficulty """
+
+    def get(self, md5: str, mods: int) -> DifficultyAttributes | None:
+        with self.lock:
+            if (attributes := self.memory.get((md5, int(mods)))) is None:
+                self.misses += 1
+                return None
+
+            self.memory.move_to_end((md5, int(mods)))
+            self.hits += 1
+            return attributes
+
+    def put(self, md5: str, mods: int, attributes: DifficultyAttributes) -> None:
+        with self.lock:
+            self.memory[(md5, int(mods))] = attributes
+
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    """ performance """
+
+    def get_performance(
+        self,
+        md5: str,
+        mods: int,
+        score_key: str,
+    ) -> AttributeValues | None:
+        with self.lock:
+            if not (
+                values := self._read(md5, mods).get("performance", {}).get(score_key)
+            ):
+                self.performance_misses += 1
+                return None
+
+            self.performance_hits += 1
+            return AttributeValues(values)
+
+    def put_performance(
+        self,
+        md5: str,
+        mods: int,
+        score_key: str,
+        attributes: Any,
+    ) -> None:
+        path: Path = self._path(md5, mods)
+
+        # NOTE: batch workers add scores of the same map at the same time.
+        with self.lock, cachestore.lock(path):
+            performance: dict[str, Any] = self._read(md5, mods).get("performance", {})
+            performance.pop(score_key, None)
+            performance[score_key] = AttributeValues.from_attributes(attributes).values
+
+            while len(performance) > PERFORMANCE_ENTRIES:
+                del performance[next(iter(performance))]
+
+            cachestore.write(path, json.dumps({"performance": performance}).encode())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "performance_hits": self.performance_hits,
+            "performance_misses": self.performance_misses,
+        }
+
+
+cache: DifficultyCache = DifficultyCache(CACHE_FOLDER)
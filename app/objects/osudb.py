@@ -0,0 +1,178 @@
+""" osudb.py - memory mapped reader for osu!stable's osu!.db """
+from __future__ import annotations
+
+import mmap
+import struct
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+# Versions where the beatmap entry layout changed.
+VERSION_FLOAT_DIFFICULTY: int = 20140609  # AR/CS/HP/OD as floats, star ratings
+VERSION_NO_ENTRY_SIZE: int = 20191106  # entries stop being prefixed by their size
+VERSION_FLOAT_STAR_RATINGS: int = 20250107  # star ratings stored as int-float pairs
+
+# Fixed size parts of an entry we don't care about.
+STAR_RATING_PAIR_SIZE: int = 14  # 0x08 int 0x0d double
+STAR_RATING_FLOAT_PAIR_SIZE: int = 10  # 0x08 int 0x0c float
+TIMING_POINT_SIZE: int = 17  # double bpm, double offset, bool inherited
+
+
+@dataclass
+class OsuDbBeatmap:
+    md5: str
+    folder: str
+    filename: str
+    set_id: int
+    beatmap_id: int
+
+
+class OsuDatabase:
+    """
+    Only reads what's needed to find a beatmap on disk, everything else gets
+    skipped over by offset. The file is mapped instead of read, so even a
+    database with a few hundred thousand maps doesn't end up in memory.
+    """
+
+    def __init__(self, path: Path, view: mmap.mmap) -> None:
+        self.path: Path = path
+        self.view: mmap.mmap = view
+
+        self.version: int = 0
+        self.player_name: str = ""
+        self.beatmap_count: int = 0
+        self.beatmaps_offset: int = 0
+
+    def __enter__(self) -> OsuDatabase:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @classmethod
+    def from_file(cls, path: Path) -> OsuDatabase:
+        with path.open("rb") as file:
+            view: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        database: OsuDatabase = cls(path, view)
+        database.parse()
+
+        return database
+
+    def close(self) -> None:
+        self.view.close()
+
+    def parse(self) -> None:
+        # version, folder count, account unlocked, unlock date
+        self.version = self.read_int(0)
+        self.player_name, offset = self.read_string(4 + 4 + 1 + 8)
+        self.beatmap_count = self.read_int(offset)
+        self.beatmaps_offset = offset + 4
+
+    def beatmaps(self) -> Iterator[OsuDbBeatmap]:
+        offset: int = self.beatmaps_offset
+
+        for _ in range(self.beatmap_count):
+            if self.version < VERSION_NO_ENTRY_SIZE:
+                entry_end: int = offset + 4 + self.read_int(offset)
+                beatmap, _ = self.read_beatmap(offset + 4)
+                offset = entry_end
+            else:
+                beatmap, offset = self.read_beatmap(offset)
+
+            yield beatmap
+
+    def read_beatmap(self, offset: int) -> tuple[OsuDbBeatmap, int]:
+        # artist, artist unicode, title, title unicode, creator, difficulty, audio file
+        for _ in range(7):
+            offset = self.skip_string(offset)
+
+        md5, offset = self.read_string(offset)
+        filename, offset = self.read_string(offset)
+
+        # ranked status, circle/slider/spinner counts, last modification time
+        offset += 1 + 2 * 3 + 8
+
+        if self.version < VERSION_FLOAT_DIFFICULTY:
+            offset += 1 * 4  # AR, CS, HP, OD
+        else:
+            offset += 4 * 4
+
+        offset += 8  # slider velocity
+
+        if self.version >= VERSION_FLOAT_DIFFICULTY:
+            pair_size: int = (
+                STAR_RATING_FLOAT_PAIR_SIZE
+                if self.version >= VERSION_FLOAT_STAR_RATINGS
+                else STAR_RATING_PAIR_SIZE
+            )
+
+            for _ in range(4):  # one list per mode
+                offset += 4 + self.read_int(offset) * pair_size
+
+        offset += 4 * 3  # drain time, total time, audio preview
+        offset += 4 + self.read_int(offset) * TIMING_POINT_SIZE
+
+        beatmap_id, set_id = struct.unpack_from("<ii", self.view, offset)
+        offset += 4 * 3  # beatmap id, set id, thread id
+
+        # grades, local offset, stack leniency, mode
+        offset += 4 + 2 + 4 + 1
+        offset = self.skip_string(offset)  # source
+        offset = self.skip_string(offset)  # tags
+        offset += 2  # online offset
+        offset = self.skip_string(offset)  # title font
+
+        offset += 1 + 8 + 1  # unplayed, last played, osz2
+        folder, offset = self.read_string(offset)
+
+        # last checked, ignore sound/skin, disable storyboard/video, visual override
+        offset += 8 + 5
+
+        if self.version < VERSION_FLOAT_DIFFICULTY:
+            offset += 2
+
+        offset += 4 + 1  # last modification time (again), mania scroll speed
+
+        return (
+            OsuDbBeatmap(
+                md5=md5,
+                folder=folder,
+                filename=filename,
+                set_id=set_id,
+                beatmap_id=beatmap_id,
+            ),
+            offset,
+        )
+
+    # read FNs
+    def read_int(self, offset: int) -> int:
+        return struct.unpack_from("<i", self.view, offset)[0]
+
+    def read_uleb128(self, offset: int) -> tuple[int, int]:
+        val = shift = 0
+
+        while True:
+            b = self.view[offset]
+            offset += 1
+
+            val |= (b & 127) << shift
+            if (b & 128) == 0x00:
+                break
+            shift += 7
+
+        return val, offset
+
+    def skip_string(self, offset: int) -> int:
+        if self.view[offset] == 0x00:
+            return offset + 1
+
+        length, offset = self.read_uleb128(offset + 1)
+        return offset + length
+
+    def read_string(self, offset: int) -> tuple[str, int]:
+        if self.view[offset] == 0x00:
+            return "", offset + 1
+
+        length, offset = self.read_uleb128(offset + 1)
+        return self.view[offset : offset + length].decode("utf-8"), offset + length
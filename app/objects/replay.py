@@ -3,14 +3,26 @@
 """
 from __future__ import annotations
 
-import os
+import lzma
+import struct
 from dataclasses import dataclass
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
 from enum import IntEnum
 from enum import IntFlag
 from enum import unique
+from functools import cached_property
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
+
+# Reading
+HEADER_READ_SIZE: int = 4096
+HEADER_TAIL: struct.Struct = struct.Struct("<6hiHBi")  # hits, score, combo, fc, mods
+DOTNET_EPOCH: datetime = datetime(1, 1, 1, tzinfo=timezone.utc)
+
 
 @unique
 class Mods(IntFlag):
@@ -141,6 +153,22 @@ class Accuracy:
         ) * 100
 
 
+@dataclass
+class ReplayFrames:
+    time_delta: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    keys: np.ndarray
+    seed: int | None = None
+
+    def __len__(self) -> int:
+        return len(self.time_delta)
+
+    @property
+    def time(self) -> np.ndarray:
+        return np.cumsum(self.time_delta)
+
+
 class ReplayInfo:
     def __init__(self) -> None:
         self.mode: Mode | None = None
@@ -156,79 +184,197 @@ class ReplayInfo:
         self.is_perfect: bool | None = None
         self.mods: Mods | None = None
 
-        self.view: memoryview | None = None
+        # Everything is read straight out of one buffer, `header_size` is where
+        # the lazily decoded part (life bar, timestamp, frames...) starts.
+        self.path: Path | None = None
+        self.view: memoryview = memoryview(b"")
+        self.header_size: int = 0
 
     @classmethod
-    def from_file(cls, filepath: str | Path) -> ReplayInfo:
+    def from_file(cls, filepath: str | Path, header_only: bool = False) -> ReplayInfo:
         if not (path := Path(filepath)).exists():
-            print("[Replay] Failed to load replay file, exiting!")
-            os._exit(1)
+            print("[Replay] Failed to load replay file!")
+            raise FileNotFoundError(f"Replay file not found: {path}")
 
         replay: ReplayInfo = cls()
-        replay.view = memoryview(path.read_bytes())
+        replay.path = path
+
+        # NOTE: the header is tiny, no need to read the whole file when scanning.
+        if header_only:
+            with path.open("rb") as file:
+                replay.view = memoryview(file.read(HEADER_READ_SIZE))
+        else:
+            replay.view = memoryview(path.read_bytes())
+
         replay.parse()
 
-        print("[Replay] Replay loaded!")
+        if not header_only:
+            print("[Replay] Replay loaded!")
 
         return replay
 
-    def parse(self) -> None:
-        self.mode = Mode.from_bytes(self.read_byte(), "little")
+    @classmethod
+    def from_bytes(cls, data: bytes) -> ReplayInfo:
+        replay: ReplayInfo = cls()
+        replay.view = memoryview(data)
+        replay.parse()
+
+        return replay
 
-        self.client_version = self.read_int()
-        self.beatmap_md5 = self.read_string()
-        self.player_name = self.read_string()
-        self.replay_md5 = self.read_string()
+    def parse(self) -> None:
+        offset: int = 0
+
+        self.mode = Mode(self.read_byte(offset))
+        self.client_version = self.read_int(offset + 1)
+        self.beatmap_md5, offset = self.read_string(offset + 5)
+        self.player_name, offset = self.read_string(offset)
+        self.replay_md5, offset = self.read_string(offset)
+
+        self.ensure(offset + HEADER_TAIL.size)
+        (
+            hit300,
+            hit100,
+            hit50,
+            hitgeki,
+            hitkatu,
+            hitmiss,
+            self.score,
+            self.max_combo,
+            is_perfect,
+            mods,
+        ) = HEADER_TAIL.unpack_from(self.view, offset)
 
         self.accuracy = Accuracy(
-            hit300=self.read_short(),  # type: ignore
-            hit100=self.read_short(),  # type: ignore
-            hit50=self.read_short(),  # type: ignore
-            hitgeki=self.read_short(),  # type: ignore
-            hitkatu=self.read_short(),  # type: ignore
-            hitmiss=self.read_short(),  # type: ignore
+            hit300=hit300,
+            hit100=hit100,
+            hit50=hit50,
+            hitgeki=hitgeki,
+            hitkatu=hitkatu,
+            hitmiss=hitmiss,
         )  # suck my dick
+        self.is_perfect = is_perfect == 0x01
+        self.mods = Mods(mods)
 
-        self.score = self.read_int()
-        self.max_combo = self.read_short()
-        self.is_perfect = self.read_byte() == 0x01
-        self.mods = Mods(self.read_int())
+        self.header_size = offset + HEADER_TAIL.size
+
+    """ lazy fields """
+
+    @cached_property
+    def _layout(self) -> tuple[str, int, int, int, int]:
+        life_bar, offset = self.read_string(self.header_size)
+
+        self.ensure(offset + 12)
+        timestamp, frames_size = struct.unpack_from("<qi", self.view, offset)
+        frames_offset: int = offset + 12
+        offset = frames_offset + max(frames_size, 0)
+
+        # NOTE: really old replays only have 4 bytes for the score id.
+        if self.client_version and self.client_version < 20140721:
+            score_id = self.read_int(offset)
+        else:
+            self.ensure(offset + 8)
+            (score_id,) = struct.unpack_from("<q", self.view, offset)
+
+        return life_bar, timestamp, frames_offset, frames_size, score_id
+
+    @property
+    def life_bar(self) -> list[tuple[int, float]]:
+        points: list[tuple[int, float]] = []
+
+        for point in self._layout[0].split(","):
+            if "|" in point:
+                time, health = point.split("|", 1)
+                points.append((int(time), float(health)))
+
+        return points
+
+    @property
+    def timestamp(self) -> datetime:
+        return DOTNET_EPOCH + timedelta(microseconds=self._layout[1] // 10)
+
+    @property
+    def score_id(self) -> int:
+        return self._layout[4]
+
+    @cached_property
+    def frames(self) -> ReplayFrames:
+        _, _, frames_offset, frames_size, _ = self._layout
+        raw: str = ""
+
+        # NOTE: some api downloads (and broken replays) come without any frames.
+        if frames_size > 0:
+            self.ensure(frames_offset + frames_size)
+
+            raw = (
+                lzma.decompress(
+                    self.view[frames_offset : frames_offset + frames_size],
+                )
+                .decode("ascii")
+                .strip(",")
+            )
+
+        # w|x|y|z,w|x|y|z,... -> one flat array -> (n, 4)
+        values: np.ndarray = (
+            np.array(raw.replace("|", ",").split(","), dtype=float).reshape(-1, 4)
+            if raw
+            else np.empty((0, 4))
+        )
+
+        seed: int | None = None
+        if len(values) and values[-1, 0] == -12345:
+            seed = int(values[-1, 3])
+            values = values[:-1]
+
+        return ReplayFrames(
+            time_delta=values[:, 0].astype(np.int64),
+            x=values[:, 1].astype(np.float32),
+            y=values[:, 2].astype(np.float32),
+            keys=values[:, 3].astype(np.int32),
+            seed=seed,
+        )
 
     # read FNs
-    def read_byte(self, length: int = 1) -> bytes:
-        if (
-            self.view
-        ):  # NOTE: fuckin lint kept saying "oh no this might be none ohhhh nooo!!!!"
-            val = self.view[:length].tobytes()
-            self.view = self.view[length:]
-            return val
+    def ensure(self, size: int) -> None:
+        """makes sure `size` bytes are available, a header-only read loads the rest"""
+        if size <= len(self.view):
+            return
 
-        return b""
+        if self.path and len(self.view) == HEADER_READ_SIZE:
+            self.view = memoryview(self.path.read_bytes())
 
-    def read_short(self) -> int | None:
-        return int.from_bytes(self.read_byte(2), "little", signed=True)
+        if size > len(self.view):
+            raise ValueError("[Replay] Replay file is truncated.")
 
-    def read_int(self) -> int:
-        return int.from_bytes(self.read_byte(4), "little", signed=True)
+    def read_byte(self, offset: int) -> int:
+        self.ensure(offset + 1)
+        return self.view[offset]
 
-    def read_uleb128(self) -> int:
+    def read_int(self, offset: int) -> int:
+        self.ensure(offset + 4)
+        return struct.unpack_from("<i", self.view, offset)[0]
+
+    def read_uleb128(self, offset: int) -> tuple[int, int]:
         val = shift = 0
 
         while True:
-            b = self.read_byte()[0]
+            b = self.read_byte(offset)
+            offset += 1
 
             val |= (b & 127) << shift
             if (b & 128) == 0x00:
                 break
             shift += 7
 
-        return val
+        return val, offset
+
+    def read_string(self, offset: int) -> tuple[str, int]:
+        if self.read_byte(offset) == 0x00:
+            return "", offset + 1
 
-    def read_string(self) -> str:
-        if self.read_byte() == 0x00:
-            return ""
+        length, offset = self.read_uleb128(offset + 1)
+        self.ensure(offset + length)
 
-        return self.read_byte(length=self.read_uleb128()).decode()
+        return str(self.view[offset : offset + length], "utf-8"), offset + length
 
 
 if __name__ == "__main__":
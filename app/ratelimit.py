@@ -0,0 +1,87 @@
+""" ratelimit.py - token buckets per host, shared by threads and batch workers """
+from __future__ import annotations
+
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+import app.config
+import app.utils
+from app.filelock import FileLock
+
+# 429 without a (usable) Retry-After
+DEFAULT_RETRY_AFTER: float = 10.0
+
+
+def _lock(host: str) -> FileLock:
+    return FileLock(app.utils.CACHE_FOLDER / "ratelimit" / f"{host}.json")
+
+
+def acquire(host: str) -> float:
+    """blocks until a request to `host` is allowed, returns how long that took"""
+    if not (limit := app.config.current.rate_limits.get(host)):
+        return 0.0
+
+    rate: float = limit.per_minute / 60
+    waited: float = 0.0
+
+    while True:
+        with _lock(host) as lock:
+            state: dict[str, float] = lock.read_json()
+            now: float = time.time()
+
+            # Refill
+            tokens: float = min(
+                limit.burst,
+                state.get("tokens", limit.burst)
+                + (now - state.get("updated", now)) * rate,
+            )
+            blocked_until: float = state.get("blocked_until", 0.0)
+
+            if blocked_until > now:
+                wait: float = blocked_until - now
+            elif tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+
+            lock.write_json(
+                {"tokens": tokens, "updated": now, "blocked_until": blocked_until},
+            )
+
+        if wait <= 0:
+            return waited
+
+        # Sleep outside of the lock so the others can still check in.
+        time.sleep(wait)
+        waited += wait
+
+
+def block(host: str, seconds: float) -> None:
+    """nobody talks to `host` for `seconds`, used when it answers with a 429"""
+    with _lock(host) as lock:
+        state: dict[str, float] = lock.read_json()
+        now: float = time.time()
+
+        state["blocked_until"] = max(state.get("blocked_until", 0.0), now + seconds)
+        state["tokens"] = 0.0
+        state["updated"] = now
+
+        lock.write_json(state)
+
+
+def parse_retry_after(value: str | None) -> float:
+    """Retry-After is either a number of seconds or an http date"""
+    if not value:
+        return DEFAULT_RETRY_AFTER
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
@@ -0,0 +1,48 @@
+""" singleflight.py - concurrent calls for the same thing share one result """
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+from collections.abc import Hashable
+from concurrent.futures import Future
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    The first caller for a key does the work, whoever asks for the same key
+    while it's still at it just waits for that result (or exception) instead
+    of downloading the same thing again. Nothing is kept once the call is over.
+    """
+
+    def __init__(self) -> None:
+        self.lock: threading.Lock = threading.Lock()
+        self.calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self.lock:
+            if (future := self.calls.get(key)) is not None:
+                leader: bool = False
+            else:
+                future = self.calls[key] = Future()
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            result: T = fn()
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+        future.set_result(result)
+        return result
+
+
+flights: SingleFlight = SingleFlight()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import math
 import time
 from pathlib import Path
 from typing import Any
@@ -7,17 +8,24 @@ from typing import Any
 import requests
 from PIL import Image
 
+import app.http
+from app import httpcache
 from app.generation.common.vector import Vector2
 from app.objects import api
 from app.version import Version
 
 API_KEY_FILE: Path = Path.cwd() / "apikey.txt"
 CACHE_FOLDER: Path = Path.cwd() / ".cache"
-AVATAR_FOLDER: Path = CACHE_FOLDER / "avatar"
+AVATAR_FOLDER: Path = CACHE_FOLDER / "avatars"
+LEGACY_AVATAR_FOLDER: Path = CACHE_FOLDER / "avatar"
+TOKEN_FOLDER: Path = CACHE_FOLDER / "token"
+
+# Resizes by a big factor go through a cheap integer reduce first (see PIL's `reducing_gap`).
+REDUCING_GAP: float = 3.0
 
 
 def get_api_client() -> api.APIWrapper:
-    return api.APIWrapper.from_file(API_KEY_FILE)
+    return api.get_client(API_KEY_FILE, token_directory=TOKEN_FOLDER)
 
 
 def ensure_directories() -> int:
@@ -28,8 +36,6 @@ def ensure_directories() -> int:
 
 
 def ensure_default_assets() -> int:
-    session: requests.Session = requests.Session()
-
     # Default
     default_assets_and_url: dict[str, str] = {
         "default_avatar.png": "https://a.ppy.sh/",
@@ -40,19 +46,23 @@ def ensure_default_assets() -> int:
     }
 
     for filename, url in default_assets_and_url.items():
-        if not (file_path := CACHE_FOLDER / filename).exists():
-            print(f"[Startup] Getting default assets: {filename},", end="")
-
-            # Download the motherfucking file
-            with session.get(url) as res:
-                if res.status_code != 200 and len(res.content) < 2048:
-                    print(" failed!")
-                    print(
-                        f"[Startup] Might want to put your own files in place there, `{file_path.resolve()}`.",
-                    )
-
-                print(" success!")
-                file_path.write_bytes(res.content)
+        file_path: Path = CACHE_FOLDER / filename
+
+        if not file_path.exists():
+            print(f"[Startup] Getting default assets: {filename}")
+
+        # NOTE: files that were already there are left alone, they might be someone's own.
+        if not httpcache.fetch(
+            url,
+            file_path,
+            ttl=httpcache.DEFAULT_ASSET_TTL,
+            keep_existing=True,
+            kind="font" if file_path.suffix == ".ttf" else "image",
+        ):
+            print(f"[Startup] Failed to get default assets: {filename}")
+            print(
+                f"[Startup] Might want to put your own files in place there, `{file_path.resolve()}`.",
+            )
 
     return 0
 
@@ -61,27 +71,28 @@ def ensure_up_to_date(current_version: Version) -> int:
     print(f"[Version] Current version: {current_version!r}")
     print(f"[Version] Checking github for a new version of osr2png,", end="")
 
-    with requests.Session() as session:
-        with session.get(
-            "https://api.github.com/repos/xjunko/osr2png/releases/latest",
-        ) as res:
-            if res.status_code != 200:
-                print(" failed!")
-                return 0
+    session: requests.Session = app.http.get_session()
+
+    with session.get(
+        "https://api.github.com/repos/xjunko/osr2png/releases/latest",
+    ) as res:
+        if res.status_code != 200:
+            print(" failed!")
+            return 0
 
-            data: dict[Any, Any] = res.json()
+        data: dict[Any, Any] = res.json()
 
-            github_version = Version.from_str(data["tag_name"])
+        github_version = Version.from_str(data["tag_name"])
 
-            print(" success!")
+        print(" success!")
 
-            # Compare our version with github's
-            if github_version > current_version:
-                print("[Version] You're using an older version of osr2png.")
-                print("[Version] You can update it from here:", data["html_url"])
-                time.sleep(3)
-            else:
-                print("[Version] You're using the latest version of osr2png.")
+        # Compare our version with github's
+        if github_version > current_version:
+            print("[Version] You're using an older version of osr2png.")
+            print("[Version] You can update it from here:", data["html_url"])
+            time.sleep(3)
+        else:
+            print("[Version] You're using the latest version of osr2png.")
 
     return 0
 
@@ -98,22 +109,88 @@ def resize_image_to_resolution_but_keep_ratio(
     return img.resize((int(img.width * ratio), int(img.height * ratio)), Image.LANCZOS)
 
 
-def get_player_avatar(name: str) -> Path:
-    api_client: api.APIWrapper = get_api_client()
-    session: requests.Session = requests.Session()
+def fit_image_to_resolution(img: Image.Image, resolution: Vector2) -> Image.Image:
+    """scales `img` to cover `resolution`, cropping whatever sticks out evenly on both sides"""
+    width, height = int(resolution.x), int(resolution.y)
+    scale: float = max(width / img.width, height / img.height)
+    crop_width, crop_height = width / scale, height / scale
+
+    left: float = (img.width - crop_width) / 2
+    top: float = (img.height - crop_height) / 2
+
+    return img.resize(
+        (width, height),
+        Image.LANCZOS,
+        box=(left, top, left + crop_width, top + crop_height),
+        reducing_gap=REDUCING_GAP,
+    )
+
+
+def open_image(path: Path, size: tuple[int, int] | None = None) -> Image.Image:
+    """
+    Opens `path`. JPEGs much bigger than what's needed to cover `size` only
+    get decoded at 1/2, 1/4 or 1/8 scale, a 4K cover for a 720p render
+    doesn't need every pixel.
+    """
+    img: Image.Image = Image.open(path)
 
-    if not (avatar_path := AVATAR_FOLDER / name).exists():
-        if not (user_id := api_client.get_player_id(name)):
-            return CACHE_FOLDER / "default_avatar.png"
+    if size:
+        scale: float = max(size[0] / img.width, size[1] / img.height)
+        img.draft(
+            img.mode,
+            (math.ceil(img.width * scale), math.ceil(img.height * scale)),
+        )
 
-        # Download
-        print(f"[API] Downloading {name}'s avatar,", end="")
-        with session.get(f"https://a.ppy.sh/{user_id}") as avatar_res:
-            if avatar_res.status_code != 200 and len(avatar_res.content) < 2000:
-                print(" failed.")
-                return CACHE_FOLDER / "default_avatar.png"
+    # NOTE: palette and grayscale images can't be blurred or resized smoothly.
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
 
-            print(" success!")
-        avatar_path.write_bytes(avatar_res.content)
+    return img
 
-    return avatar_path
+
+def open_image_for_resolution(path: Path, resolution: Vector2) -> Image.Image:
+    """`path` decoded close to `resolution` and cover-fitted to it"""
+    return fit_image_to_resolution(
+        open_image(path, (int(resolution.x), int(resolution.y))),
+        resolution,
+    )
+
+
+def get_player_id(name: str) -> int | None:
+    """player name -> user id, remembered for a while since people do get renamed"""
+    key: str = f"user_id:{name.lower()}"
+
+    if (user_id := httpcache.get_value(key, ttl=httpcache.USER_ID_TTL)) is not (
+        httpcache.MISSING
+    ):
+        return user_id
+
+    try:
+        user_id = get_api_client().get_player_id(name) or None
+    except requests.RequestException as err:
+        print(f"[API] Failed to get {name}'s user id: {err}")
+        return None  # Not their fault, ask again next time.
+    except Exception as err:
+        print(f"[API] Couldn't find {name}: {err}")
+        user_id = None
+
+    httpcache.put_value(key, user_id)
+    return user_id
+
+
+def get_player_avatar(name: str) -> Path:
+    if (user_id := get_player_id(name)) and (
+        avatar_path := httpcache.fetch(
+            f"https://a.ppy.sh/{user_id}",
+            AVATAR_FOLDER / str(user_id),
+            ttl=httpcache.AVATAR_TTL,
+            kind="image",
+        )
+    ):
+        return avatar_path
+
+    # Avatars used to be saved by name, better than nothing when offline.
+    if (legacy_path := LEGACY_AVATAR_FOLDER / name).exists():
+        return legacy_path
+
+    return CACHE_FOLDER / "default_avatar.png"
@@ -1,17 +1,30 @@
+from __future__ import annotations
+
 import os
+import queue
 import sys
+import threading
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from dataclasses import dataclass
+from dataclasses import field
 from pathlib import Path
+from tkinter import filedialog
+from tkinter import messagebox
+from tkinter import ttk
 
+import app.cache
 import app.utils
-from app.gazo import Replay2Picture
-from app.generation.common import vector
+from app.batch import RenderJob
+from app.batch import RenderOptions
+from app.batch import RenderResult
+from app.batch import RenderStage
+from app.batch import run_job
 from app.version import Version
 
 # Constants
 CURRENT_VERSION = Version.from_str("0.8.3")
 PRESET_FILE = "preset.txt"
+POLL_INTERVAL_MS = 100
 STYLE_TYPES = ["style 1", "style 2"]
 DEFAULTS = {
     "message": "",
@@ -45,6 +58,22 @@ def save_presets(values):
             f.write(f"{key}: {values[key]}\n")
 
 
+@dataclass
+class QueueItem:
+    path: Path
+    stage: RenderStage = RenderStage.pending
+    result: RenderResult | None = None
+    queued: bool = False
+    started: threading.Event = field(default_factory=threading.Event)
+    cancelled: threading.Event = field(default_factory=threading.Event)
+
+    def describe(self):
+        text = f"{self.path.name} - {self.stage.value}"
+        if self.result and self.result.error:
+            text += f" ({self.result.error})"
+        return text
+
+
 class Display(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -54,22 +83,39 @@ class Display(tk.Tk):
         # Load presets
         presets = load_preset()
         self.vars = {k: tk.StringVar(value=presets[k]) for k in DEFAULTS}
-        self.replay_path = tk.StringVar()
         self.beatmap_path = tk.StringVar()
+        self.status = tk.StringVar(value="Idle")
+
+        # Render queue, the pipeline runs on the worker thread and reports
+        # back through `events` which gets polled with `after()`.
+        self.items: list[QueueItem] = []
+        self.items_lock = threading.Lock()
+        self.jobs: queue.Queue = queue.Queue()
+        self.events: queue.Queue = queue.Queue()
+        self.initialized = False
 
         # Widgets setup
         self.create_widgets()
         self.grid_columnconfigure(1, weight=1)
 
+        threading.Thread(target=self.render_worker, daemon=True).start()
+        self.after(POLL_INTERVAL_MS, self.poll_events)
+
     def browse_replay(self):
-        path = filedialog.askopenfilename(
-            title="Select replay file", filetypes=[("OSR files", "*.osr")]
+        paths = filedialog.askopenfilenames(
+            title="Select replay files", filetypes=[("OSR files", "*.osr")]
         )
-        if path:
-            self.replay_path.set(path)
+        for path in paths:
+            item = QueueItem(path=Path(path))
+            self.items.append(item)
+            self.replay_list.insert("end", item.describe())
+        if paths:
             # Update window title
-            stem = Path(path).stem
-            self.title(f"osr2png - {stem}")
+            if len(paths) == 1:
+                self.title(f"osr2png - {Path(paths[0]).stem}")
+            else:
+                self.title(f"osr2png - {len(paths)} replays")
+            self.update_status()
 
     def browse_beatmap(self):
         path = filedialog.askopenfilename(
@@ -79,15 +125,15 @@ class Display(tk.Tk):
             self.beatmap_path.set(path)
 
     def create_widgets(self):
-        # Replay selector
-        tk.Label(self, text="Replay (.osr):").grid(
-            row=0, column=0, sticky="e", padx=5, pady=2
-        )
-        tk.Entry(self, textvariable=self.replay_path, state="readonly").grid(
-            row=0, column=1, sticky="ew", padx=5
+        # Replay queue
+        tk.Label(self, text="Replays (.osr):").grid(
+            row=0, column=0, sticky="ne", padx=5, pady=2
         )
+        self.replay_list = tk.Listbox(self, height=6, selectmode="extended")
+        self.replay_list.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+        self.replay_list.bind("<Double-Button-1>", self.on_open)
         tk.Button(self, text="Browse", command=self.browse_replay).grid(
-            row=0, column=2, padx=5
+            row=0, column=2, sticky="n", padx=5, pady=2
         )
 
         # Beatmap selector
@@ -127,65 +173,146 @@ class Display(tk.Tk):
             side="left", padx=5
         )
         tk.Button(frame, text="Run", command=self.on_run).pack(side="left", padx=5)
+        tk.Button(frame, text="Cancel Selected", command=self.on_cancel).pack(
+            side="left", padx=5
+        )
+
+        # Status
+        tk.Label(self, textvariable=self.status, anchor="w").grid(
+            row=btn_row + 1, column=0, columnspan=3, sticky="ew", padx=5, pady=2
+        )
 
     def on_save(self):
         values = {k: self.vars[k].get() for k in DEFAULTS}
         save_presets(values)
         messagebox.showinfo("Saved", f"{PRESET_FILE} updated.")
 
+    def read_options(self):
+        return RenderOptions(
+            style=int(self.vars["style"].get().split(" ")[1]),
+            width=int(self.vars["width"].get()),
+            height=int(self.vars["height"].get()),
+            dim=float(self.vars["dim"].get()),
+            blur=float(self.vars["blur"].get()),
+            border=float(self.vars["border"].get()),
+            message=self.vars["message"].get(),
+        )
+
     def on_run(self):
-        # Validate replay
-        if not self.replay_path.get():
-            messagebox.showerror("Error", "Replay file is required.")
+        # Validate replays
+        pending = [
+            item
+            for item in self.items
+            if item.stage is RenderStage.pending and not item.queued
+        ]
+        if not pending:
+            messagebox.showerror("Error", "Add at least one replay file first.")
             return
-        # Init tasks
-        for task in (app.utils.ensure_directories, app.utils.ensure_default_assets):
-            if code := task():
-                messagebox.showerror("Init Error", f"Init failed: {code}")
-                return
-        # Version check
         try:
-            app.utils.ensure_up_to_date(CURRENT_VERSION)
-        except Exception:
-            pass
-        # Paths
-        replay_file = Path(self.replay_path.get())
+            options = self.read_options()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid settings:\n{e}")
+            return
         beatmap_file = (
             Path(self.beatmap_path.get()) if self.beatmap_path.get() else None
         )
-        # Construct output in Downloads with same stem
-        stem = replay_file.stem
-        output_file = f"{stem}.png"
-        # Debug
-        print(f"Replay: {replay_file}\nBeatmap: {beatmap_file}\nOutput: {output_file}")
-        try:
-            # Generate
-            replay = Replay2Picture.from_replay_file(
-                replay_path=replay_file, beatmap_file=beatmap_file
+        for item in pending:
+            item.queued = True
+            self.jobs.put(
+                (item, RenderJob(item.path, beatmap_path=beatmap_file, options=options))
             )
-            replay.calculate()
-            result = replay.generate(
-                style=int(self.vars["style"].get().split(" ")[1]),
-                resolution=vector.Vector2(
-                    x=int(self.vars["width"].get()), y=int(self.vars["height"].get())
-                ),
-                background_dim=float(self.vars["dim"].get()),
-                background_blur=float(self.vars["blur"].get()),
-                background_border=float(self.vars["border"].get()),
-                message=self.vars["message"].get(),
-                custom_filename=str(output_file),
+        self.update_status()
+
+    def on_cancel(self):
+        for index in self.replay_list.curselection():
+            item = self.items[index]
+            with self.items_lock:
+                if item.started.is_set() or item.stage is not RenderStage.pending:
+                    continue
+                item.cancelled.set()
+            item.stage = RenderStage.cancelled
+            self.refresh_item(item)
+        self.update_status()
+
+    def on_open(self, _event):
+        for index in self.replay_list.curselection():
+            result = self.items[index].result
+            if result and result.ok and sys.platform.startswith("win"):
+                os.startfile(str(result.output_path))
+
+    def render_worker(self):
+        while True:
+            item, job = self.jobs.get()
+            with self.items_lock:
+                if item.cancelled.is_set():
+                    continue
+                item.started.set()
+
+            if not self.initialized:
+                self.events.put((item, RenderStage.loading, None))
+                # Init tasks
+                for task in (
+                    app.utils.ensure_directories,
+                    app.utils.ensure_default_assets,
+                    app.cache.ensure_within_limit,
+                ):
+                    if code := task():
+                        result = RenderResult(
+                            job.replay_path, error=f"Init failed: {code}"
+                        )
+                        self.events.put((item, RenderStage.failed, result))
+                        break
+                else:
+                    self.initialized = True
+                if not self.initialized:
+                    continue
+                # Version check
+                try:
+                    app.utils.ensure_up_to_date(CURRENT_VERSION)
+                except Exception:
+                    pass
+
+            # Debug
+            print(f"Replay: {job.replay_path}\nBeatmap: {job.beatmap_path}")
+            result = run_job(
+                job, on_stage=lambda stage: self.events.put((item, stage, None))
             )
-            saved = Path(result) if result else output_file
-            if not saved.exists():
-                messagebox.showerror(
-                    "Error", f"File not found after generation:\n{saved}"
-                )
-                return
-            messagebox.showinfo("Done", f"Image saved to:\n{saved}")
-            if sys.platform.startswith("win"):
-                os.startfile(str(saved))
-        except Exception as e:
-            messagebox.showerror("Error", f"Generation failed:\n{e}")
+            if result.ok and not result.output_path.exists():
+                result.error = f"File not found after generation: {result.output_path}"
+            stage = RenderStage.done if result.ok else RenderStage.failed
+            self.events.put((item, stage, result))
+
+    def poll_events(self):
+        try:
+            while True:
+                item, stage, result = self.events.get_nowait()
+                item.stage = stage
+                item.result = result or item.result
+                self.refresh_item(item)
+        except queue.Empty:
+            pass
+        self.update_status()
+        self.after(POLL_INTERVAL_MS, self.poll_events)
+
+    def refresh_item(self, item):
+        index = self.items.index(item)
+        self.replay_list.delete(index)
+        self.replay_list.insert(index, item.describe())
+
+    def update_status(self):
+        counts = {}
+        for item in self.items:
+            counts[item.stage] = counts.get(item.stage, 0) + 1
+        if not counts:
+            self.status.set("Idle")
+            return
+        self.status.set(
+            ", ".join(
+                f"{count} {stage.value}"
+                for stage in RenderStage
+                if (count := counts.get(stage))
+            )
+        )
 
 
 if __name__ == "__main__":